@@ -1,48 +1,177 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory
+from flask import Flask, current_app, render_template, request, redirect, url_for, flash, session, jsonify, abort
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import random
+import time
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from datetime import datetime
 
-# Import blueprints
-from case.cases_routes import bp as cases_bp
-from case.case2_routes import case2_bp
-from cmd_module.routes import bp as cmd_drills_bp
-from quiz.quiz_routes import quiz_bp
+import db
+import evidence_jobs
+import file_serving
+import live
+import metrics
+import evidence_store
+import migrations
+import page_cache
+import passwords
+import progress
+import ratelimit
+import sessions
+import sql_trace
+import startup
+import static_assets
+import write_behind
+from db import get_db
+
+# Importing this module has no side effects: nothing touches the disk or the
+# databases until create_app() runs. Under a pre-forking server, build the
+# app once in the master (gunicorn --preload wsgi:app) and let workers fork.
 
-from db import get_db_connection
-
-# -------------------------
-# App setup
-# -------------------------
 BASE_DIR = os.path.dirname(__file__)
 DB_PATH = os.path.join(BASE_DIR, "database.db")
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-app = Flask(__name__, static_folder="static", template_folder="templates")
-app.secret_key = "supersecretkey"  # Change this for production
 
-# Register blueprints
-app.register_blueprint(cmd_drills_bp, url_prefix="/cmd-drills")
-app.register_blueprint(cases_bp, url_prefix="/cases")
-app.register_blueprint(case2_bp)  # url_prefix already set in case2_routes.py
-app.register_blueprint(quiz_bp)
 
-
-# Secret + configs
-app.secret_key = os.environ.get("CYBERCASE_SECRET", "dev-secret-change-me")
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5 MB max upload
+# -------------------------
+# App setup
+# -------------------------
+def default_config():
+    """Settings read from the environment when the app is created."""
+    return {
+        "SECRET_KEY": os.environ.get("CYBERCASE_SECRET", "dev-secret-change-me"),
+        "UPLOAD_FOLDER": UPLOAD_FOLDER,
+        # Uploads are spooled and streamed to disk in chunks, so this only bounds disk use
+        "MAX_CONTENT_LENGTH": 100 * 1024 * 1024,  # 100 MB max upload
+        # Behind nginx/Apache, let the front end stream files via X-Sendfile
+        "USE_X_SENDFILE": os.environ.get("CYBERCASE_X_SENDFILE") == "1",
+        # Session data lives server-side; the cookie only holds an opaque id. "memory" is
+        # faster but per-process, so only for single-process servers
+        "SESSION_BACKEND": os.environ.get("CYBERCASE_SESSION_BACKEND", "sqlite"),
+        # Per-endpoint latency/status histograms at /metrics; CYBERCASE_METRICS=0 turns them off
+        "METRICS": os.environ.get("CYBERCASE_METRICS", "1") != "0",
+        # CYBERCASE_SQL_TRACE=1 logs slow/unindexed queries and adds X-SQL-* headers
+        "SQL_TRACE": os.environ.get("CYBERCASE_SQL_TRACE") == "1",
+        "SLOW_QUERY_MS": float(os.environ.get("CYBERCASE_SLOW_QUERY_MS", "100")),
+        # Token buckets for login and answer checks, in memory per process; "sqlite" shares
+        # them between workers at one write per limited POST (see wsgi.py), "off" disables
+        "RATELIMIT_BACKEND": os.environ.get("CYBERCASE_RATELIMIT_BACKEND", "memory"),
+        # Rendered HTML of the static narrative pages, revalidated by ETag; CYBERCASE_PAGE_CACHE=0 turns it off
+        "PAGE_CACHE": os.environ.get("CYBERCASE_PAGE_CACHE", "1") != "0",
+        # Open SSE streams per process; keep it below gunicorn's --threads (see wsgi.py)
+        "LIVE_MAX_STREAMS": int(os.environ.get("CYBERCASE_LIVE_MAX_STREAMS", "500")),
+        # Migrations and the asset build; turn off when a release step runs `flask startup`
+        "STARTUP_TASKS": os.environ.get("CYBERCASE_STARTUP_TASKS", "1") != "0",
+    }
+
+
+def create_app(config=None):
+    """Build a configured app. `config` overrides the environment defaults;
+    DATABASES={"main": path, ...} points it at other database files. The
+    databases are per process: a later app with other paths raises."""
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder="static", template_folder="templates")
+    app.config.update(default_config())
+    app.config.update(config or {})
+    if app.config.get("DATABASES"):
+        db.configure(**app.config["DATABASES"])
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    with startup.step(app, "blueprints"):
+        register_blueprints(app)
+        register_routes(app)
+    db.init_app(app)
+    migrations.init_app(app)
+
+    @app.cli.command("startup")
+    def startup_command():
+        """Run the once-per-deployment tasks (migrations, asset build) and exit."""
+        run_startup_tasks(app)
+        steps = app.extensions["startup"]["steps"]
+        print("migrations and assets up to date (migrations %.0fms, assets %.0fms)"
+              % (steps["migrations"], steps["assets"]))
+
+    if app.config["STARTUP_TASKS"]:
+        run_startup_tasks(app)
+    else:
+        with startup.step(app, "assets"):
+            static_assets.init_app(app, build=False)
+    with startup.step(app, "catalog"):
+        from cmd_module.catalog import catalog as drill_catalog
+        drill_catalog.load()  # compile every drill's accepted commands once
+
+    with startup.step(app, "extensions"):
+        store = evidence_store.init_app(app)
+        evidence_jobs.init_app(app, store.blob_path)  # EVIDENCE_WORKERS / EVIDENCE_WORKER_MODE tune the pool
+        passwords.init_app(app)  # PASSWORD_HASH_METHOD / _WORKERS / _QUEUE set the cost and pool size
+        sessions.init_app(app)
+        ratelimit.init_app(app)
+        page_cache.init_app(app)  # PAGE_CACHE_SIZE bounds the LRU; template edits empty it
+        write_behind.init_app(app)  # score/attempt writes are group-committed off the request path
+        live.init_app(app)  # SSE fan-out for the live leaderboard; LIVE_MAX_STREAMS caps open streams
+        metrics.init_app(app)
+        sql_trace.init_app(app)
+    startup.finish(app, started)  # STARTUP_BUDGET_MS sets the cold-start budget
+    return app
+
+
+def run_startup_tasks(app):
+    """Schema migrations and the static asset build, once per deployment.
+
+    Both are idempotent and serialised by a lock file, so when several
+    workers start together one does the work and the others find it done.
+    """
+    with startup.deployment_lock(app):
+        with startup.step(app, "migrations"):
+            migrations.migrate_all()
+        with startup.step(app, "assets"):
+            if "assets" in app.extensions:
+                app.extensions["assets"].load_or_build()
+            else:
+                static_assets.init_app(app)
+
+
+def register_blueprints(app):
+    # Imported here so that importing app.py stays cheap
+    from case.cases_routes import bp as cases_bp
+    from case.case2_routes import case2_bp
+    from cmd_module.routes import bp as cmd_drills_bp
+    from contest.contest_routes import contest_bp
+    from quiz.quiz_routes import quiz_bp
+
+    app.register_blueprint(cmd_drills_bp, url_prefix="/cmd-drills")
+    app.register_blueprint(cases_bp, url_prefix="/cases")
+    app.register_blueprint(case2_bp)  # url_prefix already set in case2_routes.py
+    app.register_blueprint(quiz_bp)
+    app.register_blueprint(contest_bp)  # also adds `flask contest create|list`
+
+
+def register_routes(app):
+    app.add_url_rule("/", view_func=index)
+    app.add_url_rule("/signup", view_func=signup, methods=["GET", "POST"])
+    app.add_url_rule("/login", view_func=login, methods=["GET", "POST"])
+    app.add_url_rule("/logout", view_func=logout)
+    app.add_url_rule("/home", view_func=home)
+    app.add_url_rule("/alerts", view_func=alerts)
+    app.add_url_rule("/evidence", view_func=evidence, methods=["GET", "POST"])
+    app.add_url_rule("/evidence/<int:evidence_id>/status", view_func=evidence_status)
+    app.add_url_rule("/evidence/<int:evidence_id>/delete", view_func=evidence_delete, methods=["POST"])
+    app.add_url_rule("/uploads/<filename>", view_func=uploaded_file)
+    app.add_url_rule("/about", view_func=about)
+    app.add_url_rule("/password_game", view_func=password_game)
 
 
 # -------------------------
 # Routes
 # -------------------------
 
-@app.route("/")
+def hasher_busy(template):
+    """Fast-fail page when the password hashing pool is saturated."""
+    flash("⏳ Lots of agents are signing in right now. Please try again in a few seconds.")
+    return render_template(template), 503, {"Retry-After": "3"}
+
+
 def index():
     """Redirect root to login page if not logged in"""
     if session.get("user_id"):
@@ -50,7 +179,7 @@ def index():
     return redirect(url_for("login"))
 
 
-@app.route("/signup", methods=["GET", "POST"])
+@ratelimit.limit("auth", rate=60, per=60, key=ratelimit.by_ip)  # a whole classroom can share one NAT
 def signup():
     if request.method == "POST":
         username = request.form.get("username", "").strip()
@@ -61,9 +190,12 @@ def signup():
             flash("Email and password are required.")
             return redirect(url_for("signup"))
 
-        hashed = generate_password_hash(password)
+        try:
+            hashed = passwords.get_hasher().hash(password)
+        except passwords.HasherBusy:
+            return hasher_busy("signup.html")
 
-        conn = get_db_connection()
+        conn = get_db()
         cur = conn.cursor()
         try:
             cur.execute(
@@ -73,31 +205,38 @@ def signup():
             conn.commit()
         except sqlite3.IntegrityError:
             flash("⚠️ Email already registered! Try logging in.")
-            conn.close()
             return redirect(url_for("signup"))
 
-        conn.close()
         flash("✅ Account created! Please log in.")
         return redirect(url_for("login"))
 
     return render_template("signup.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@ratelimit.limit("auth", rate=60, per=60, key=ratelimit.by_ip)
+@ratelimit.limit("login", rate=5, per=60, burst=10, key=ratelimit.by_ip_and_email)
 def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
 
-        conn = get_db_connection()
-        user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
-        conn.close()
+        user = get_db(readonly=True).execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
 
         if user is None:
             flash("⚠️ No account found with that email.")
             return redirect(url_for("login"))
 
-        if check_password_hash(user["password"], password):
+        try:
+            ok, new_hash = passwords.get_hasher().verify_and_update(user["password"], password)
+        except passwords.HasherBusy:
+            return hasher_busy("login.html")
+
+        if ok:
+            if new_hash:
+                # Stored hash predates the current cost policy: upgrade it transparently
+                conn = get_db()
+                conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_hash, user["id"]))
+                conn.commit()
             # set session values
             session.clear()
             session["user_id"] = user["id"]
@@ -111,33 +250,28 @@ def login():
     return render_template("login.html")
 
 
-@app.route("/logout")
 def logout():
     session.clear()
     flash("Logged out.")
     return redirect(url_for("login"))
 
 
-@app.route("/home")
 def home():
     """User dashboard after login"""
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("login"))
 
-    conn = get_db_connection()
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    write_behind.get_writer().flush(timeout=2)  # show the result just submitted
+    summary = progress.get_progress(user_id)
 
-    # Safe defaults
-    user_name = user["username"] if user and "username" in user.keys() and user["username"] else "Agent"
-    points = user["last_score"] if user and "points" in user.keys() else 0
-    badge = user["last_badge"] if user and "badge" in user.keys() else "Newbie"
+    user_name = session.get("user_name") or "Agent"
+    points = summary["points"]
+    badge = summary["quiz_last_badge"] or "Newbie"
 
-    return render_template("home.html", user_name=user_name, points=points, badge=badge)
+    return render_template("home.html", user_name=user_name, points=points, badge=badge, progress=summary)
 
 
-@app.route("/alerts")
 def alerts():
     """Threat intel alerts (placeholder)"""
     if not session.get("user_id"):
@@ -150,13 +284,13 @@ def alerts():
     return render_template("alerts.html", alerts=sample_alerts)
 
 
-@app.route("/evidence", methods=["GET", "POST"])
 def evidence():
     """Evidence file upload"""
     if not session.get("user_id"):
         return redirect(url_for("login"))
 
-    uploaded_filename = None
+    store = evidence_store.get_store()
+    uploaded = None
     message = None
 
     if request.method == "POST":
@@ -169,28 +303,64 @@ def evidence():
             flash("No selected file")
             return redirect(url_for("evidence"))
 
-        filename = secure_filename(file.filename)
-        saved_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(saved_path)
+        uploaded = store.save(file.stream, session["user_id"], file.filename, file.mimetype)
+        evidence_jobs.get_queue().enqueue(get_db(), uploaded["id"])
+        message = "File uploaded. Analysis is running in the background."
 
-        uploaded_filename = filename
-        message = "File uploaded. (Processing not implemented in demo.)"
+    return render_template("evidence.html", uploaded=uploaded, message=message,
+                           uploads=store.list_for_user(session["user_id"]))
 
-    return render_template("evidence.html", uploaded_filename=uploaded_filename, message=message)
 
+def evidence_delete(evidence_id):
+    """Delete one of the user's uploads; its blob goes with the last reference"""
+    if not session.get("user_id"):
+        return redirect(url_for("login"))
+    store = evidence_store.get_store()
+    row = store.get(evidence_id)
+    if row is None or row["uploader_id"] != session["user_id"]:
+        abort(404)
+    store.release(evidence_id)
+    flash("Deleted %s" % (row["original_name"] or row["sha256"][:12]))
+    return redirect(url_for("evidence"))
 
-@app.route("/uploads/<filename>")
-def uploaded_file(filename):
-    """Serve uploaded files (testing only)"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+
+def evidence_status(evidence_id):
+    """Processing status of one uploaded evidence file"""
+    if not session.get("user_id"):
+        return jsonify({"error": "not_logged_in"}), 403
+    row = evidence_store.get_store().get(evidence_id)
+    if row is None or row["uploader_id"] != session["user_id"]:
+        return jsonify({"error": "not_found"}), 404
+    status = evidence_jobs.JobQueue.status(get_db(), evidence_id) or {"status": "unknown"}
+    return jsonify(dict(status, evidence_id=evidence_id, sha256=row["sha256"]))
 
 
-@app.route("/about")
+def uploaded_file(filename):
+    """Serve uploaded files (testing only); content hashes resolve through the store"""
+    store = evidence_store.get_store()
+    row = store.find_by_hash(filename)
+    if row is not None:
+        # Blobs are content-addressed: the hash is a strong ETag and never goes stale
+        resp = file_serving.send_validated_file(
+            store.blob_path(row["sha256"]), etag=row["sha256"], immutable=True,
+            mimetype=row["mime"], as_attachment=True,
+            download_name=secure_filename(row["original_name"] or "") or row["sha256"],
+        )
+    else:
+        # Files saved before the content-addressed store existed
+        path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        resp = file_serving.send_validated_file(path, as_attachment=True)
+    resp.cache_control.private = True
+    return resp
+
+
+@page_cache.cached_page
 def about():
     return render_template("about.html")
 
 
-@app.route("/password_game")
 def password_game():
     """Simple strong/weak password game"""
     STRONG_PASSWORDS = [
@@ -218,4 +388,4 @@ def password_game():
 # Main
 # -------------------------
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
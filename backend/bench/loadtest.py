@@ -0,0 +1,331 @@
+# bench/loadtest.py
+"""Drive the real app with scripted user journeys and report latencies.
+
+    python bench/loadtest.py --users 8 --iterations 20
+    python bench/loadtest.py --mode wsgi --users 16 --save bench/baseline.json
+    python bench/loadtest.py --compare bench/baseline.json --threshold 0.25
+
+Every run works on copies of the databases and a scratch upload folder,
+so the checked-in .db files are never touched. --mode client calls the
+app through the werkzeug test client from N threads; --mode wsgi serves
+it on a threaded werkzeug server and talks real HTTP.
+"""
+import argparse, http.cookiejar, io, json, os, random, shutil, sys, tempfile, threading, time, uuid
+import urllib.error, urllib.parse, urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+
+# -------------------- App setup --------------------
+def build_app(workdir):
+    """Create the app against scratch copies of every database."""
+    import db
+    paths = {}
+    for name, path in db.DATABASES.items():
+        copy = os.path.join(workdir, name + ".db")
+        if os.path.exists(path):
+            shutil.copyfile(path, copy)
+        paths[name] = copy
+
+    from app import create_app
+    # Every virtual user shares one IP and hammers the same forms, so rate limits would skew the run
+    return create_app({"DATABASES": paths, "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+                       "RATELIMIT_BACKEND": "off"})
+
+
+# -------------------- Clients --------------------
+class Response:
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class TestClientSession:
+    """One virtual user on the werkzeug test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None, files=None):
+        data = dict(form or {})
+        for field, (name, content) in (files or {}).items():
+            data[field] = (io.BytesIO(content), name)
+        resp = self.client.open(path, method=method, data=data or None, json=json_body)
+        return Response(resp.status_code, resp.get_data(), resp.headers)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One virtual user talking HTTP to a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, form=None, json_body=None, files=None):
+        headers, body = {}, None
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for key, value in (form or {}).items():
+                parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n'
+                              % (boundary, key, value)).encode())
+            for field, (name, content) in files.items():
+                parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                              'Content-Type: application/octet-stream\r\n\r\n' % (boundary, field, name)).encode()
+                             + content + b"\r\n")
+            body = b"".join(parts) + ("--%s--\r\n" % boundary).encode()
+            headers["Content-Type"] = "multipart/form-data; boundary=" + boundary
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            body = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as resp:
+                return Response(resp.status, resp.read(), resp.headers)
+        except urllib.error.HTTPError as e:
+            return Response(e.code, e.read(), e.headers)
+
+
+def serve_threaded(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_port
+
+
+# -------------------- Recording --------------------
+class Recorder:
+    def __init__(self):
+        self.samples = {}       # label -> [seconds]
+        self.errors = {}        # label -> count
+        self._lock = threading.Lock()
+
+    def call(self, session, label, method, path, expect=(200, 302, 304), **kwargs):
+        start = time.perf_counter()
+        resp = session.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.setdefault(label, []).append(elapsed)
+            if resp.status not in expect:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return resp
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, wall):
+    report = {}
+    for label, values in sorted(recorder.samples.items()):
+        values = sorted(values)
+        report[label] = {
+            "count": len(values),
+            "errors": recorder.errors.get(label, 0),
+            "rps": len(values) / wall if wall else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return report
+
+
+# -------------------- Journeys --------------------
+def journey_login(rec, s, user):
+    rec.call(s, "GET /login", "GET", "/login")
+    rec.call(s, "POST /login", "POST", "/login", form={"email": user["email"], "password": user["password"]})
+    rec.call(s, "GET /home", "GET", "/home")
+
+
+def journey_quiz(rec, s, user):
+    resp = rec.call(s, "POST /quiz/start", "POST", "/quiz/start", json_body={})
+    if resp.status != 200:
+        return
+    questions = resp.json()["questions"]
+    answers = {str(q["id"]): random.randrange(len(q["options"])) for q in questions}
+    rec.call(s, "POST /quiz/submit", "POST", "/quiz/submit", json_body={"answers": answers})
+    period = random.choice(("all", "daily", "weekly"))
+    rec.call(s, "GET /quiz/leaderboard/data", "GET", "/quiz/leaderboard/data?period=" + period)
+
+
+def journey_case1(rec, s, user):
+    rec.call(s, "GET /cases/case1", "GET", "/cases/case1")
+    rec.call(s, "GET /cases/messages", "GET", "/cases/messages")
+    answer = "krithika" if random.random() < 0.5 else "someone"
+    rec.call(s, "POST /cases/check_answer", "POST", "/cases/check_answer", form={"answer": answer})
+    rec.call(s, "GET /cases/mission_complete", "GET", "/cases/mission_complete")
+
+
+def journey_case2(rec, s, user):
+    rec.call(s, "GET /case2/start", "GET", "/case2/start?show_hidden=%d" % random.randint(0, 1))
+    file_id = random.randint(1, 10)
+    rec.call(s, "GET /case2/file/<id>", "GET", "/case2/file/%d" % file_id)
+    rec.call(s, "GET /case2/properties/<id>", "GET", "/case2/properties/%d" % file_id)
+    rec.call(s, "GET /case2/assessment", "GET", "/case2/assessment")
+    rec.call(s, "POST /case2/assessment", "POST", "/case2/assessment",
+             form={"malware_id": str(random.randint(1, 10)), "sensitive_id": "7", "exif_hint": "flag"})
+
+
+DRILL_ATTEMPTS = {1: ['echo "hello world"', "echo hi"], 2: ["ls -p | grep -v / | wc -l", "ls | wc"],
+                  3: ["head -n 1 sample.txt", "cat sample.txt"], 4: ["grep -Rn TODO .", "grep TODO"]}
+
+
+def journey_drills(rec, s, user):
+    level = random.choice(list(DRILL_ATTEMPTS))
+    rec.call(s, "GET /cmd-drills/level/<id>", "GET", "/cmd-drills/level/%d" % level)
+    rec.call(s, "POST /cmd-drills/level/<id>", "POST", "/cmd-drills/level/%d" % level,
+             form={"command": random.choice(DRILL_ATTEMPTS[level])})
+
+
+def journey_evidence(rec, s, user):
+    content = os.urandom(random.choice((2048, 32 * 1024, 256 * 1024)))
+    rec.call(s, "POST /evidence", "POST", "/evidence", files={"evidence_file": ("evidence.bin", content)})
+
+
+JOURNEYS = [
+    (journey_quiz, 4),
+    (journey_case1, 2),
+    (journey_case2, 3),
+    (journey_drills, 3),
+    (journey_evidence, 1),
+]
+
+
+def virtual_user(rec, make_session, index, iterations, run_id):
+    s = make_session()
+    user = {"username": "bench%s_%d" % (run_id, index),
+            "email": "bench%s_%d@example.com" % (run_id, index),
+            "password": "bench-password-%d" % index}
+    rec.call(s, "POST /signup", "POST", "/signup", form=user)
+    journey_login(rec, s, user)
+    funcs = [f for f, weight in JOURNEYS for _ in range(weight)]
+    for _ in range(iterations):
+        random.choice(funcs)(rec, s, user)
+
+
+# -------------------- Baselines --------------------
+def compare(report, baseline, threshold, min_delta_ms):
+    """List of regressions of `report` against a saved baseline."""
+    problems = []
+    for label, base in baseline.get("endpoints", {}).items():
+        cur = report.get(label)
+        if cur is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = base[key] * (1 + threshold)
+            if cur[key] > limit and cur[key] - base[key] > min_delta_ms:
+                problems.append("%s %s %.1fms > %.1fms" % (label, key, cur[key], base[key]))
+        if cur["errors"] > base.get("errors", 0):
+            problems.append("%s errors %d > %d" % (label, cur["errors"], base.get("errors", 0)))
+    return problems
+
+
+def print_report(report, wall, total):
+    print("%-32s %7s %6s %8s %9s %9s %9s" % ("endpoint", "count", "err", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for label, row in report.items():
+        print("%-32s %7d %6d %8.1f %9.2f %9.2f %9.2f" % (
+            label, row["count"], row["errors"], row["rps"], row["p50_ms"], row["p95_ms"], row["p99_ms"]))
+    print("%d requests in %.2fs (%.1f req/s)" % (total, wall, total / wall if wall else 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("client", "wsgi"), default="client")
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=20, help="journeys per user")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sql-trace", action="store_true", help="list statements whose plan scans a whole table")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="fail if slower than this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.sql_trace:
+        os.environ["CYBERCASE_SQL_TRACE"] = "1"
+    workdir = tempfile.mkdtemp(prefix="cybercase-bench-")
+    try:
+        app = build_app(workdir)
+        server = None
+        if args.mode == "wsgi":
+            server, base_url = serve_threaded(app)
+            make_session = lambda: HttpSession(base_url)
+        else:
+            make_session = lambda: TestClientSession(app)
+
+        rec = Recorder()
+        run_id = uuid.uuid4().hex[:6]
+        threads = [threading.Thread(target=virtual_user, args=(rec, make_session, i, args.iterations, run_id))
+                   for i in range(args.users)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+        if server is not None:
+            server.shutdown()
+        # Let background writers finish before the scratch dir goes away
+        app.extensions["write_behind"].stop()
+        app.extensions["evidence_jobs"].stop()
+
+        report = summarize(rec, wall)
+        total = sum(row["count"] for row in report.values())
+        print_report(report, wall, total)
+        tracer = app.extensions.get("sql_trace")
+        if tracer is not None:
+            scans = [row for row in tracer.report() if row["full_scans"]]
+            print("%d statements with full table scans" % len(scans))
+            for row in scans:
+                print("  %s\n      %s" % (row["sql"], "; ".join(row["full_scans"])))
+
+        result = {"mode": args.mode, "users": args.users, "iterations": args.iterations,
+                  "wall_s": wall, "requests": total, "endpoints": report}
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            print("baseline saved to", args.save)
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+            if baseline.get("mode") != args.mode:
+                print("warning: baseline was recorded in %s mode" % baseline.get("mode"))
+            problems = compare(report, baseline, args.threshold, args.min_delta_ms)
+            if problems:
+                print("REGRESSIONS:")
+                for line in problems:
+                    print("  " + line)
+                return 1
+            print("no regressions against", args.compare)
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# bench/score_writes.py
+"""Statements and time per case1 answer submission: old path vs upsert.
+
+    python bench/score_writes.py --users 200 --submits 2000
+
+"first" has every user answer once, correctly; "mixed" replays random
+right/wrong answers from a smaller pool of users. Both write paths run
+against scratch copies of the main schema, counting what SQLite actually
+executes (via the sqlite3 trace callback) including the BEGIN/COMMITs
+the sqlite3 module issues.
+"""
+import argparse, os, random, shutil, sys, tempfile, time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import db, migrations
+
+LEGACY_VERSION = 5      # last main migration before user_scores.user_id became unique
+
+
+def legacy_submit(conn, user_id, correct):
+    """check_answer before unique keys: SELECT, INSERT, UPDATE, two commits."""
+    row = conn.execute("SELECT id FROM user_scores WHERE user_id=?", (user_id,)).fetchone()
+    if not row:
+        conn.execute("INSERT INTO user_scores (user_id, score, status) VALUES (?, 0, 'not cleared')", (user_id,))
+        conn.commit()
+    if correct:
+        conn.execute("UPDATE user_scores SET score=?, status=? WHERE user_id=?", (100, 'cleared', user_id))
+        conn.commit()
+
+
+def upsert_submit(conn, user_id, correct):
+    if correct:
+        conn.execute("INSERT INTO user_scores (user_id, score, status) VALUES (?, 100, 'cleared') "
+                     "ON CONFLICT(user_id) DO UPDATE SET score=excluded.score, status=excluded.status", (user_id,))
+    else:
+        conn.execute("INSERT INTO user_scores (user_id, score, status) VALUES (?, 0, 'not cleared') "
+                     "ON CONFLICT(user_id) DO NOTHING", (user_id,))
+    conn.commit()
+
+
+def build_schema(up_to=None):
+    """Apply main migrations, optionally stopping at version `up_to`."""
+    for version, _, step in migrations.MIGRATIONS["main"]:
+        if up_to is not None and version > up_to:
+            break
+        conn = db.connect("main")
+        if callable(step):
+            step(conn)
+        else:
+            migrations.run_sql(conn, step)
+        conn.commit()
+        conn.close()
+
+
+def run(submit, plan):
+    conn = db.connect("main")
+    counts = {"statements": 0, "commits": 0}
+
+    def trace(statement):
+        if statement.startswith("COMMIT"):
+            counts["commits"] += 1
+        elif not statement.startswith("BEGIN"):
+            counts["statements"] += 1
+
+    conn.set_trace_callback(trace)
+    start = time.perf_counter()
+    for user_id, correct in plan:
+        submit(conn, user_id, correct)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return counts, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--submits", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    scenarios = (
+        ("first", [(user_id, True) for user_id in range(1, args.submits + 1)]),
+        ("mixed", [(rng.randint(1, args.users), rng.random() < 0.5) for _ in range(args.submits)]),
+    )
+    workdir = tempfile.mkdtemp(prefix="cybercase-scores-")
+    try:
+        print("%-8s %-8s %10s %12s %10s" % ("scenario", "path", "stmts/sub", "commits/sub", "us/submit"))
+        for scenario, plan in scenarios:
+            for label, submit, version in (("legacy", legacy_submit, LEGACY_VERSION), ("upsert", upsert_submit, None)):
+                db.configure(main=os.path.join(workdir, "%s-%s.db" % (scenario, label)))
+                build_schema(version)
+                counts, elapsed = run(submit, plan)
+                print("%-8s %-8s %10.2f %12.2f %10.1f" % (
+                    scenario, label, counts["statements"] / len(plan), counts["commits"] / len(plan),
+                    elapsed / len(plan) * 1e6))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# case/usb_snapshot.py
+import base64, hashlib, json, os, threading
+from types import MappingProxyType
+
+from db import get_db
+
+# Files the assessment asks the player to identify
+MALWARE_FILE = "Invoice.pdf.exe"
+SENSITIVE_FILE = "confidential.txt"
+EXIF_FILE = "city.jpg"
+
+
+class UsbSnapshot:
+    """Immutable, fully indexed copy of usb_case.db.
+
+    The `files` and `settings` tables are static seed data, so the case2
+    routes read everything from here instead of querying per request.
+    """
+
+    def __init__(self, file_rows, setting_rows):
+        files = [MappingProxyType(dict(row)) for row in file_rows]
+        settings = {row["key"]: row["val"] for row in setting_rows}
+
+        self.by_id = MappingProxyType({f["id"]: f for f in files})
+        by_name = {f["name"]: f for f in files}
+
+        children = {}
+        for f in sorted(files, key=lambda f: f["name"]):
+            children.setdefault(f["parent_id"], []).append(f)
+        self.children = MappingProxyType({pid: tuple(kids) for pid, kids in children.items()})
+
+        # Root listings for both states of the "Show Hidden" toggle
+        self.roots_all = self.children.get(None, ())
+        self.roots_visible = tuple(f for f in self.roots_all if not f["is_hidden"])
+
+        # settings rows named exif_<stem> belong to the file <stem>.<ext>
+        exif = {}
+        for f in files:
+            raw = settings.get("exif_" + os.path.splitext(f["name"])[0])
+            if raw:
+                exif[f["id"]] = MappingProxyType(json.loads(raw))
+        self.exif = MappingProxyType(exif)
+
+        # Answer key, resolved once instead of by name on every POST
+        self.malware_id = by_name[MALWARE_FILE]["id"] if MALWARE_FILE in by_name else None
+        self.sensitive_id = by_name[SENSITIVE_FILE]["id"] if SENSITIVE_FILE in by_name else None
+        comment = exif.get(by_name[EXIF_FILE]["id"], {}).get("UserComment") if EXIF_FILE in by_name else None
+        self.exif_phrase = base64.b64decode(comment).decode() if comment else None
+
+        # Changes whenever the seed data does; used to build ETags
+        digest = hashlib.sha1(json.dumps(
+            [[dict(f) for f in files], sorted(settings.items())], sort_keys=True, default=str
+        ).encode())
+        self.version = digest.hexdigest()[:16]
+
+    def roots(self, show_hidden):
+        return self.roots_all if show_hidden else self.roots_visible
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def load_snapshot():
+    """Read both tables and build a fresh snapshot."""
+    conn = get_db("usb_case", readonly=True)
+    return UsbSnapshot(
+        conn.execute("SELECT * FROM files").fetchall(),
+        conn.execute("SELECT key, val FROM settings").fetchall(),
+    )
+
+
+def get_snapshot():
+    """The process-wide snapshot, loaded on first use."""
+    global _snapshot
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = load_snapshot()
+    return _snapshot
+
+
+def reload_snapshot():
+    """Rebuild after the seed data has been changed (e.g. a new migration)."""
+    global _snapshot
+    with _lock:
+        _snapshot = load_snapshot()
+    return _snapshot
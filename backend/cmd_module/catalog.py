@@ -0,0 +1,57 @@
+# cmd_module/catalog.py
+import threading
+
+from db import connect
+from cmd_module.matcher import CommandMatcher
+
+
+class LevelCatalog:
+    """All drill levels, loaded once per process with their matchers precompiled.
+
+    Levels change only through migrations, so the catalog is read from
+    challenges.db on first use (or an explicit load()) and served from
+    memory afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.levels = None      # ordered list of level dicts
+        self.by_id = {}
+        self.matchers = {}
+
+    def load(self):
+        conn = connect("challenges", readonly=True)
+        try:
+            rows = conn.execute("SELECT * FROM levels ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        levels, by_id, matchers = [], {}, {}
+        for row in rows:
+            level = dict(row)
+            variants = [level["solution"]] + (level.get("alternatives") or "").splitlines()
+            levels.append(level)
+            by_id[level["id"]] = level
+            matchers[level["id"]] = CommandMatcher(v for v in variants if v.strip())
+        with self._lock:
+            self.levels, self.by_id, self.matchers = levels, by_id, matchers
+        return levels
+
+    def _ensure(self):
+        if self.levels is None:
+            self.load()
+
+    def all(self):
+        self._ensure()
+        return self.levels
+
+    def get(self, level_id):
+        self._ensure()
+        return self.by_id.get(level_id)
+
+    def check(self, level_id, command):
+        self._ensure()
+        matcher = self.matchers.get(level_id)
+        return matcher is not None and matcher.matches(command)
+
+
+catalog = LevelCatalog()
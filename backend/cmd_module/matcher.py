@@ -0,0 +1,162 @@
+# cmd_module/matcher.py
+import shlex
+
+# Operators that split a command line into stages
+OPERATORS = {"|", "||", "&&", ";", "&", ">", ">>", "<", "2>", "2>>", "2>&1"}
+
+# Operators that may start a line or follow another operator
+REDIRECTS = {">", ">>", "<", "2>", "2>>", "2>&1"}
+
+# Short options that take a value, per program ("-n 1", "-n1", "-A2")
+VALUE_OPTS = {
+    "head": "nc",
+    "tail": "nc",
+    "grep": "efmABCd",
+    "cut": "dfcb",
+    "sort": "kt",
+    "sed": "ef",
+    "awk": "Fv",
+    "xargs": "nI",
+}
+
+# Long spellings folded onto their short form
+LONG_ALIASES = {
+    "grep": {"--line-number": "-n", "--recursive": "-r", "--dereference-recursive": "-R",
+             "--ignore-case": "-i", "--invert-match": "-v", "--count": "-c",
+             "--files-with-matches": "-l", "--word-regexp": "-w", "--regexp": "-e"},
+    "head": {"--lines": "-n", "--bytes": "-c"},
+    "tail": {"--lines": "-n", "--bytes": "-c"},
+    "wc": {"--lines": "-l", "--words": "-w", "--bytes": "-c", "--chars": "-m"},
+    "ls": {"--all": "-a", "--almost-all": "-A", "--recursive": "-R"},
+    "sort": {"--reverse": "-r", "--numeric-sort": "-n", "--unique": "-u"},
+}
+
+# Programs whose arguments are order-sensitive expressions, not flags
+RAW_ARGS = {"find", "awk", "test", "["}
+
+
+def tokenize(command):
+    """Shell-like split that keeps pipes/redirections as separate tokens.
+
+    An unquoted "2" directly followed by ">" is the stderr redirection; with
+    a space between, or quoted, "2" is an ordinary argument, as in the shell:
+
+    >>> tokenize("cmd 2> f")
+    ['cmd', '2>', 'f']
+    >>> tokenize("cmd 2 > f")
+    ['cmd', '2', '>', 'f']
+    >>> tokenize("echo '2'>f")
+    ['echo', '2', '>', 'f']
+    >>> canonicalize("cmd 2 > f") == canonicalize("cmd 2> f")
+    False
+    >>> tokenize("cmd 2>&1 | grep x")
+    ['cmd', '2>&1', '|', 'grep', 'x']
+    """
+    lexer = shlex.shlex(command, posix=True, punctuation_chars="|&;<>")
+    lexer.whitespace_split = True
+    tokens, fd_redirect = [], False
+    while True:
+        tok = lexer.get_token()
+        if tok is None:
+            break
+        if tok in (">", ">>", ">&") and fd_redirect:
+            tokens[-1] = "2" + tok
+        elif tok == "1" and tokens[-1:] == ["2>&"]:
+            tokens[-1] = "2>&1"
+        else:
+            tokens.append(tok)
+        # The lexer has read one character past "2": the ">" itself if they touch.
+        # The source must also read "2>" there with nothing (like '' quotes) before it.
+        end = lexer.instream.tell() - 1
+        fd_redirect = (tok == "2" and command[end - 1:end + 1] == "2>"
+                       and (end < 2 or command[end - 2].isspace() or command[end - 2] in "|&;<>"))
+    return tokens
+
+
+def canonical_stage(words):
+    """(program, frozenset of (flag, value), operands) for one simple command."""
+    program, args = words[0], words[1:]
+    if program in RAW_ARGS:
+        return (program, frozenset(), tuple(args))
+
+    takes_value = VALUE_OPTS.get(program, "")
+    aliases = LONG_ALIASES.get(program, {})
+    flags, operands = set(), []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        i += 1
+        if arg == "--":
+            operands.extend(args[i:])
+            break
+        if arg.startswith("--"):
+            name, eq, value = arg.partition("=")
+            name = aliases.get(name, name)
+            if not eq:
+                value = None
+                if len(name) == 2 and name[1] in takes_value and i < len(args):
+                    value, i = args[i], i + 1
+            flags.add((name, value))
+        elif arg.startswith("-") and len(arg) > 1 and not arg[1:].isdigit():
+            # Clustered short flags: -Rn == -R -n; a value flag eats the rest
+            for pos, ch in enumerate(arg[1:], start=1):
+                if ch in takes_value:
+                    value = arg[pos + 1:]
+                    if not value and i < len(args):
+                        value, i = args[i], i + 1
+                    flags.add(("-" + ch, value))
+                    break
+                flags.add(("-" + ch, None))
+        elif arg.startswith("-") and arg[1:].isdigit() and program in ("head", "tail"):
+            flags.add(("-n", arg[1:]))      # obsolete "head -1" form
+        else:
+            operands.append(arg)
+
+    if program == "echo":
+        # echo joins its operands with single spaces
+        operands = [" ".join(operands)] if operands else []
+    return (program, frozenset(flags), tuple(operands))
+
+
+def canonicalize(command):
+    """Hashable canonical form of a command line, or None if it can't be parsed."""
+    try:
+        tokens = tokenize(command)
+    except ValueError:       # unbalanced quotes
+        return None
+    if not tokens:
+        return None
+    parts, words = [], []
+    for tok in tokens:
+        if tok in OPERATORS:
+            if not words and tok not in REDIRECTS:
+                return None
+            if words:
+                parts.append(canonical_stage(words))
+                words = []
+            parts.append(tok)
+        else:
+            words.append(tok)
+    if words:
+        parts.append(canonical_stage(words))
+    return tuple(parts)
+
+
+class CommandMatcher:
+    """Accepts any command equivalent to one of the level's solutions.
+
+    Every accepted variant is canonicalised once when the matcher is built;
+    a submission is canonicalised and checked with a single set lookup, so
+    matching cost doesn't depend on how many variants a level accepts.
+    """
+
+    def __init__(self, solutions):
+        self.accepted = set()
+        for solution in solutions:
+            form = canonicalize(solution)
+            if form is not None:
+                self.accepted.add(form)
+
+    def matches(self, command):
+        form = canonicalize(command)
+        return form is not None and form in self.accepted
@@ -1,67 +1,59 @@
 # cmd_module/routes.py
-from flask import Blueprint, render_template, request, redirect, url_for, g, flash
-import sqlite3, os
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 
-bp = Blueprint("cmd_drills", __name__, template_folder="templates", static_folder="static")
+from cmd_module.catalog import catalog
+from write_behind import get_writer
+import progress
+import ratelimit
+from page_cache import cached_page
+from contest.contest_routes import record_solve
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "challenges.db")
+bp = Blueprint("cmd_drills", __name__, template_folder="templates", static_folder="static")
 
-def get_db():
-    db = getattr(g, "_database", None)
-    if db is None:
-        db = g._database = sqlite3.connect(DB_PATH)
-        db.row_factory = sqlite3.Row
-    return db
+def drill_state(level_id):
+    """Attempts/cleared for one level, kept in the server-side session."""
+    return session.get("drills", {}).get(str(level_id), {"attempts": 0, "cleared": False})
 
-@bp.teardown_app_request
-def close_connection(exception):
-    db = getattr(g, "_database", None)
-    if db is not None:
-        db.close()
+def save_drill_state(level_id, state):
+    drills = session.setdefault("drills", {})
+    drills[str(level_id)] = state
+    session.modified = True  # nested dict changes aren't tracked
 
 @bp.route("/")
+@cached_page
 def index():
-    db = get_db()
-    cur = db.execute("SELECT id, title, description FROM levels ORDER BY id")
-    levels = cur.fetchall()
-    return render_template("cmd_drills/index.html", levels=levels)
+    return render_template("cmd_drills/index.html", levels=catalog.all())
 
 @bp.route("/level/<int:level_id>", methods=["GET", "POST"])
+@ratelimit.limit("drill", rate=30, per=60, burst=10)
 def level(level_id):
-    db = get_db()
-    cur = db.execute("SELECT * FROM levels WHERE id = ?", (level_id,))
-    level = cur.fetchone()
+    level = catalog.get(level_id)
     if not level:
         flash("Level not found.", "danger")
         return redirect(url_for('cmd_drills.index'))
 
-    attempts = int(request.cookies.get(f"attempts_{level_id}", "0"))
+    state = drill_state(level_id)
+    attempts = state["attempts"]
     hint_unlocked = attempts >= 2
 
     if request.method == "POST":
-        cmd = request.form.get("command", "").strip()
-        normalized = " ".join(cmd.split())
-        solution = level["solution"].strip()
-        if normalized == solution:
-            resp = redirect(url_for("cmd_drills.success", level_id=level_id))
-            resp.set_cookie(f"cleared_{level_id}", "1", max_age=60*60*24*365)
-            resp.set_cookie(f"attempts_{level_id}", "0", max_age=0)
-            return resp
+        cmd = request.form.get("command", "")
+        if catalog.check(level_id, cmd):
+            save_drill_state(level_id, {"attempts": 0, "cleared": True})
+            if session.get("user_id"):
+                get_writer().write(*progress.drill_ops(session["user_id"], level_id))
+                record_solve("drill:%d" % level_id)
+            return redirect(url_for("cmd_drills.success", level_id=level_id))
         else:
-            attempts += 1
+            save_drill_state(level_id, {"attempts": attempts + 1, "cleared": state["cleared"]})
             flash("Incorrect command. Try again.", "warning")
-            resp = redirect(url_for("cmd_drills.level", level_id=level_id))
-            resp.set_cookie(f"attempts_{level_id}", str(attempts), max_age=60*60)
-            return resp
+            return redirect(url_for("cmd_drills.level", level_id=level_id))
 
     return render_template("cmd_drills/level.html", level=level, attempts=attempts, hint_unlocked=hint_unlocked)
 
 @bp.route("/success/<int:level_id>")
 def success(level_id):
-    db = get_db()
-    cur = db.execute("SELECT id, title FROM levels WHERE id = ?", (level_id,))
-    level = cur.fetchone()
+    level = catalog.get(level_id)
     if not level:
         flash("Level not found.", "danger")
         return redirect(url_for('cmd_drills.index'))
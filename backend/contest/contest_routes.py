@@ -0,0 +1,137 @@
+from flask import Blueprint, render_template, request, session, jsonify, url_for
+import click, datetime
+
+from db import connect, get_db
+import live
+from contest.scoreboard import contests, challenge_title, parse_time, now_iso, PAGE_SIZE
+
+contest_bp = Blueprint("contest", __name__, template_folder="../templates")
+
+
+def record_solve(challenge, fraction=1.0):
+    """Score a solve for the logged-in user if a running contest includes it."""
+    user_id = session.get("user_id")
+    if user_id is None:
+        return 0
+    contest, gained = contests.record(get_db(readonly=True), user_id, session.get("user_name"), challenge, fraction)
+    if gained:
+        # Other workers learn of it from the next snapshot, which bumps the topic
+        live.get_hub().publish("contest:%d" % contest.id, user_id, share=False)
+    return gained
+
+
+def challenge_url(challenge):
+    kind, _, detail = challenge.partition(":")
+    if kind == "drill" and detail.isdigit():
+        return url_for("cmd_drills.level", level_id=int(detail))
+    return {"quiz": url_for("quiz.quiz"), "case1": url_for("cases.case1_index"),
+            "case2": url_for("case2.start")}.get(kind)
+
+
+def scoreboard_page(contest):
+    page = max(request.args.get("page", 1, type=int), 1)
+    board = contests.board(get_db(readonly=True), contest)
+    rows, total = board.page(page, PAGE_SIZE)
+    me = board.rank_of(session["user_id"]) if "user_id" in session else None
+    pages = max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    return dict(scoreboard=rows, me=me, page=page, pages=pages, total=total,
+                seconds_left=contest.seconds_left() if contest.running() else 0)
+
+
+# --- Routes ---
+@contest_bp.route("/contest")
+def contest():
+    conn = get_db(readonly=True)
+    current = contests.featured(conn)
+    if current is None:
+        return render_template("contest/contest.html", contest=None)
+    now = now_iso()
+    state = "running" if current.running(now) else ("upcoming" if current.starts_at > now else "finished")
+    board = contests.board(conn, current)
+    solved = board.solved(session["user_id"]) if "user_id" in session else {}
+    challenges = [dict(id=c, title=challenge_title(c), url=challenge_url(c), points=p, earned=solved.get(c))
+                  for c, p in sorted(current.points.items())]
+    return render_template("contest/contest.html", contest=current, state=state, challenges=challenges,
+                           **scoreboard_page(current))
+
+
+@contest_bp.route("/contest/scoreboard")
+def scoreboard():
+    current = contests.featured(get_db(readonly=True))
+    if current is None:
+        return jsonify({"error": "no_contest"}), 404
+    return jsonify(dict(scoreboard_page(current), contest=current.id, name=current.name,
+                        starts_at=current.starts_at, ends_at=current.ends_at))
+
+
+@live.renderer("contest")
+def contest_event(topic, changed):
+    """First page of a contest scoreboard, plus the ranks of users who just scored."""
+    contest_id = int(topic.split(":", 1)[1])
+    conn = get_db(readonly=True)
+    current = contests.get(conn, contest_id)
+    if current is None:
+        return {"scoreboard": [], "total": 0}
+    board = contests.board(conn, current)
+    rows, total = board.page(1, PAGE_SIZE)
+    event = dict(contest=contest_id, scoreboard=rows, total=total)
+    if changed:
+        event["changed"] = [row for row in (board.rank_of(uid) for uid in changed) if row is not None]
+    return event
+
+
+@live.refresher("contest")
+def contest_refresh(topic):
+    contests.reload(get_db(readonly=True), int(topic.split(":", 1)[1]))
+
+
+@contest_bp.route("/contest/stream")
+def stream():
+    current = contests.featured(get_db(readonly=True))
+    if current is None:
+        return jsonify({"error": "no_contest"}), 404
+    resp = live.get_hub().open_stream("contest:%d" % current.id, request.headers.get("Last-Event-ID"))
+    if resp is None:
+        return jsonify({"error": "stream_unavailable"}), 503, {"Retry-After": "10"}
+    return resp
+
+
+# --- CLI: flask contest create / list ---
+@contest_bp.cli.command("create")
+@click.argument("name")
+@click.option("--start", default="now", help="UTC start, ISO format, or 'now'.")
+@click.option("--minutes", default=60, type=int, help="Contest length.")
+@click.option("--quiz-seconds", default=90, type=int, help="Quiz timer during the contest.")
+@click.option("--challenge", "challenges", multiple=True, metavar="ID=POINTS",
+              help="e.g. quiz=100, case1=200, case2=300, drill:4=50. Repeatable.")
+def create_command(name, start, minutes, quiz_seconds, challenges):
+    """Schedule a contest."""
+    starts_at = parse_time(start)
+    ends_at = (datetime.datetime.fromisoformat(starts_at) + datetime.timedelta(minutes=minutes)).isoformat()
+    points = {}
+    for item in challenges or ("quiz=100", "case1=200", "case2=300"):
+        challenge, _, value = item.partition("=")
+        points[challenge.strip()] = int(value or 100)
+    conn = connect("main")
+    try:
+        cur = conn.execute("INSERT INTO contests (name, starts_at, ends_at, quiz_seconds, created_at) "
+                           "VALUES (?, ?, ?, ?, ?)", (name, starts_at, ends_at, quiz_seconds, now_iso()))
+        conn.executemany("INSERT INTO contest_challenges (contest_id, challenge, points) VALUES (?, ?, ?)",
+                         [(cur.lastrowid, c, p) for c, p in points.items()])
+        conn.commit()
+    finally:
+        conn.close()
+    contests.invalidate()
+    print("contest %d: %s, %s to %s UTC, %s" % (
+        cur.lastrowid, name, starts_at, ends_at, ", ".join("%s=%d" % item for item in points.items())))
+
+
+@contest_bp.cli.command("list")
+def list_command():
+    """Show every contest."""
+    conn = connect("main", readonly=True)
+    try:
+        for row in conn.execute("SELECT id, name, starts_at, ends_at FROM contests ORDER BY starts_at"):
+            print("%d  %-24s %s .. %s" % (row["id"], row["name"], row["starts_at"], row["ends_at"]))
+    finally:
+        conn.close()
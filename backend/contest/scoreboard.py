@@ -0,0 +1,303 @@
+# contest/scoreboard.py
+import atexit, datetime, logging, os, threading, time
+
+from db import connect
+from live import BUMP_SQL
+from ranking import RankedList
+
+log = logging.getLogger(__name__)
+
+REFRESH_EVERY = 10.0        # seconds between re-reading contest definitions
+SNAPSHOT_EVERY = 15.0       # seconds between scoreboard snapshots
+PAGE_SIZE = 20
+
+
+def now_iso():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def parse_time(value):
+    """'now', or an ISO date/time (UTC), as the ISO string contests store."""
+    if value == "now":
+        return now_iso()
+    return datetime.datetime.fromisoformat(value).isoformat()
+
+
+def challenge_title(challenge):
+    kind, _, detail = challenge.partition(":")
+    return {"quiz": "Cyber quiz", "case1": "Case 1: lost phone", "case2": "Case 2: USB drive"}.get(
+        kind, "Command drill %s" % detail if kind == "drill" else challenge)
+
+
+class Contest:
+    """One contest's definition: a UTC window and point values per challenge.
+
+    Challenges are "quiz", "case1", "case2" and "drill:<level id>".
+    """
+
+    __slots__ = ("id", "name", "starts_at", "ends_at", "quiz_seconds", "points")
+
+    def __init__(self, id, name, starts_at, ends_at, quiz_seconds, points):
+        self.id = id
+        self.name = name
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.quiz_seconds = quiz_seconds
+        self.points = points
+
+    def running(self, when=None):
+        return self.starts_at <= (when or now_iso()) < self.ends_at
+
+    def seconds_left(self, when=None):
+        end = datetime.datetime.fromisoformat(self.ends_at)
+        now = datetime.datetime.fromisoformat(when or now_iso())
+        return max(0, int((end - now).total_seconds()))
+
+
+class Scoreboard:
+    """Live standings of one contest, updated in O(log n) per solve.
+
+    Each user keeps their best award per challenge; the score is the sum
+    and ties go to whoever reached it first. Ranks come from a RankedList
+    keyed (-score, last solve time, user id), so a solve is one remove and
+    one insert. Changed awards are remembered until the next snapshot.
+    """
+
+    def __init__(self, contest):
+        self.contest = contest
+        self._lock = threading.Lock()
+        self._users = {}            # user_id -> {"username", "awards": {challenge: (points, when)}, "key"}
+        self._ranking = RankedList()
+        self._dirty = set()         # (user_id, challenge) changed since the last snapshot
+
+    @staticmethod
+    def _key(user_id, awards):
+        score = sum(points for points, _ in awards.values())
+        last = max((when for _, when in awards.values()), default="")
+        return (-score, last, user_id)
+
+    def _award(self, user_id, username, challenge, points, when):
+        """Keep the better award; returns True if standings changed. Caller holds the lock."""
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = {"username": username, "awards": {}, "key": None}
+        elif username:
+            user["username"] = username
+        best = user["awards"].get(challenge)
+        if best is not None and best[0] >= points:
+            return False
+        user["awards"][challenge] = (points, when)
+        key = self._key(user_id, user["awards"])
+        if user["key"] is not None:
+            self._ranking.remove(user["key"])
+        self._ranking.add(key)
+        user["key"] = key
+        return True
+
+    def record(self, user_id, username, challenge, fraction, when=None):
+        """Award `fraction` of the challenge's points. Returns the points gained."""
+        value = self.contest.points.get(challenge)
+        if value is None or fraction <= 0:
+            return 0
+        points = int(round(value * min(fraction, 1.0)))
+        with self._lock:
+            before = self._users.get(user_id, {}).get("awards", {}).get(challenge, (0, None))[0]
+            if not self._award(user_id, username, challenge, points, when or now_iso()):
+                return 0
+            self._dirty.add((user_id, challenge))
+        return points - before
+
+    def merge(self, rows):
+        """Fold snapshot rows (possibly from other workers) into the standings."""
+        with self._lock:
+            for row in rows:
+                self._award(row["user_id"], row["username"], row["challenge"], row["points"], row["solved_at"])
+
+    def _row(self, key, rank):
+        user = self._users[key[2]]
+        return dict(user_id=key[2], username=user["username"], score=-key[0], solves=len(user["awards"]),
+                    last_solve_at=key[1], rank=rank)
+
+    def page(self, page=1, per_page=PAGE_SIZE):
+        start = (page - 1) * per_page
+        with self._lock:
+            keys = self._ranking.slice(start, start + per_page)
+            return [self._row(k, start + i + 1) for i, k in enumerate(keys)], len(self._ranking)
+
+    def rank_of(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            return self._row(user["key"], self._ranking.bisect_left(user["key"]) + 1)
+
+    def solved(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return {c: points for c, (points, _) in user["awards"].items()} if user else {}
+
+    def take_dirty(self):
+        """Rows for the snapshot; they are marked dirty again if the write fails."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return [(self.contest.id, user_id, challenge) + self._users[user_id]["awards"][challenge]
+                    for user_id, challenge in dirty]
+
+    def mark_dirty(self, rows):
+        with self._lock:
+            self._dirty.update((user_id, challenge) for _, user_id, challenge, _, _ in rows)
+
+
+class Contests:
+    """Contest definitions plus the live scoreboard of each contest in play.
+
+    Definitions are re-read every REFRESH_EVERY seconds, so a contest made
+    with `flask contest create` starts on time in every worker. A snapshot
+    thread writes changed awards to contest_solves every SNAPSHOT_EVERY
+    seconds and at exit, then merges back what other workers wrote; a
+    restarted process rebuilds its boards from those rows. Each snapshot
+    bumps the contest's live topic, so viewers on other workers see its
+    solves within a snapshot interval.
+    """
+
+    def __init__(self, snapshot_every=SNAPSHOT_EVERY):
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._defs = []
+        self._loaded_at = None
+        self._boards = {}           # contest id -> Scoreboard
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    # --- Definitions ---
+    def _definitions(self, conn):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < REFRESH_EVERY:
+            return self._defs
+        points = {}
+        for row in conn.execute("SELECT contest_id, challenge, points FROM contest_challenges"):
+            points.setdefault(row["contest_id"], {})[row["challenge"]] = row["points"]
+        defs = [Contest(row["id"], row["name"], row["starts_at"], row["ends_at"], row["quiz_seconds"],
+                        points.get(row["id"], {}))
+                for row in conn.execute("SELECT * FROM contests ORDER BY starts_at DESC")]
+        self._defs, self._loaded_at = defs, time.monotonic()
+        return defs
+
+    def active(self, conn, when=None):
+        """The contest running right now, if any."""
+        when = when or now_iso()
+        for contest in self._definitions(conn):
+            if contest.running(when):
+                return contest
+        return None
+
+    def get(self, conn, contest_id):
+        return next((c for c in self._definitions(conn) if c.id == contest_id), None)
+
+    def featured(self, conn, when=None):
+        """What the contest page shows: running, else next up, else the last one."""
+        when = when or now_iso()
+        defs = self._definitions(conn)
+        running = [c for c in defs if c.running(when)]
+        upcoming = [c for c in defs if c.starts_at > when]
+        if running:
+            return running[0]
+        if upcoming:
+            return upcoming[-1]
+        return defs[0] if defs else None
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    # --- Boards ---
+    def board(self, conn, contest):
+        board = self._boards.get(contest.id)
+        if board is not None:
+            return board
+        with self._lock:
+            board = self._boards.get(contest.id)
+            if board is None:
+                board = Scoreboard(contest)
+                board.merge(self._load_solves(conn, contest.id))
+                self._boards[contest.id] = board
+        return board
+
+    @staticmethod
+    def _load_solves(conn, contest_id):
+        return conn.execute(
+            "SELECT s.user_id, u.username, s.challenge, s.points, s.solved_at FROM contest_solves s "
+            "LEFT JOIN users u ON u.id = s.user_id WHERE s.contest_id = ?", (contest_id,)
+        ).fetchall()
+
+    def reload(self, conn, contest_id):
+        """Merge in solves other workers have snapshotted, if this board is loaded."""
+        board = self._boards.get(contest_id)
+        if board is not None:
+            board.merge(self._load_solves(conn, contest_id))
+
+    def record(self, conn, user_id, username, challenge, fraction):
+        """Score a solve in the running contest. Returns (contest, points gained)."""
+        when = now_iso()
+        contest = self.active(conn, when)
+        if contest is None or challenge not in contest.points:
+            return None, 0
+        self._ensure_started()
+        return contest, self.board(conn, contest).record(user_id, username, challenge, fraction, when)
+
+    # --- Snapshots ---
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="contest-snapshot", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_every):
+            try:
+                self.snapshot()
+            except Exception:
+                log.exception("contest snapshot failed")
+
+    def snapshot(self):
+        """Write changed awards to SQLite and merge in other workers'. Returns rows written."""
+        boards = list(self._boards.values())
+        if not boards:
+            return 0
+        written = 0
+        conn = connect("main")
+        try:
+            for board in boards:
+                rows = board.take_dirty()
+                if rows:
+                    try:
+                        conn.executemany(
+                            "INSERT INTO contest_solves (contest_id, user_id, challenge, points, solved_at) "
+                            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(contest_id, user_id, challenge) DO UPDATE SET "
+                            "points = excluded.points, solved_at = excluded.solved_at "
+                            "WHERE excluded.points > contest_solves.points", rows)
+                        # Other workers' hubs see the bump and reload this board
+                        conn.execute(BUMP_SQL, ("contest:%d" % board.contest.id,))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        board.mark_dirty(rows)
+                        raise
+                    written += len(rows)
+                if board.contest.running() or rows:
+                    board.merge(self._load_solves(conn, board.contest.id))
+        finally:
+            conn.close()
+        return written
+
+    def stop(self):
+        """Final snapshot; registered with atexit once snapshots are running."""
+        self._stop.set()
+        if self._pid == os.getpid():
+            self.snapshot()
+
+
+contests = Contests()
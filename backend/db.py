@@ -1,10 +1,277 @@
 # db.py
-import sqlite3, os
+import sqlite3, os, threading, time
+from urllib.request import pathname2url
 
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "database.db")
+from flask import g, has_app_context
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Every SQLite database the app talks to, by logical name
+DATABASES = {
+    "main": os.path.join(BASE_DIR, "database.db"),
+    "usb_case": os.path.join(BASE_DIR, "case", "usb_case.db"),
+    "challenges": os.path.join(BASE_DIR, "cmd_module", "challenges.db"),
+}
+DB_PATH = DATABASES["main"]
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE = 256       # prepared statements kept per connection
+MAX_IDLE = 16               # idle connections kept per pool
+
+# Applied to every connection; journal_mode is persistent but cheap to re-assert
+PRAGMAS = (
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("synchronous", "NORMAL"),          # safe with WAL, one fsync per checkpoint
+    ("mmap_size", 64 * 1024 * 1024),
+    ("cache_size", -8000),              # negative = KiB
+    ("temp_store", "MEMORY"),
+)
+
+
+# -------------------- Instrumentation --------------------
+# Observers are called as fn(conn, sql, params, seconds, phase) with phase
+# "execute" or "fetch". With none registered the wrappers cost one check.
+_query_observers = []
+_connect_hooks = []         # fn(conn, name) for every new connection
+_hook_keys = {}             # key -> fn, so a rebuilt app replaces its hooks instead of adding more
+
+
+def _register(hooks, fn, key):
+    old = _hook_keys.get((id(hooks), key)) if key is not None else None
+    if old in hooks:
+        hooks.remove(old)
+    if fn not in hooks:
+        hooks.append(fn)
+    if key is not None:
+        _hook_keys[(id(hooks), key)] = fn
+    return fn
+
+
+def observe_queries(fn, key=None):
+    """Register a callable to be told about every statement's timing.
+
+    A later registration under the same `key` replaces the earlier one.
+    """
+    return _register(_query_observers, fn, key)
+
+
+def on_connect(fn, key=None):
+    """Register a callable run on every connection connect() opens."""
+    return _register(_connect_hooks, fn, key)
+
+
+def _notify(conn, sql, params, seconds, phase):
+    for fn in _query_observers:
+        fn(conn, sql, params, seconds, phase)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not _query_observers:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql, self._params = sql, parameters
+            _notify(self.connection, sql, parameters, time.perf_counter() - start, "execute")
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _query_observers:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql, self._params = sql, None
+            _notify(self.connection, sql, None, time.perf_counter() - start, "execute")
+
+    def _timed_fetch(self, fetch, *args):
+        if not _query_observers:
+            return fetch(*args)
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            _notify(self.connection, getattr(self, "_sql", None), getattr(self, "_params", None),
+                    time.perf_counter() - start, "fetch")
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute's) report timings."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts would bypass the cursor class above
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(name="main", readonly=False):
+    """Open a new tuned connection. Prefer `get_db()` inside the app."""
+    path = DATABASES[name]
+    if readonly:
+        conn = sqlite3.connect(
+            "file:%s?mode=ro" % pathname2url(path), uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE,
+            check_same_thread=False, factory=InstrumentedConnection,
+        )
+    else:
+        conn = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE,
+            check_same_thread=False, factory=InstrumentedConnection,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+    for pragma, value in PRAGMAS:
+        conn.execute("PRAGMA %s=%s" % (pragma, value))
     conn.row_factory = sqlite3.Row
+    conn.path = path        # pools only take back connections to their own file
+    for hook in _connect_hooks:
+        hook(conn, name)
     return conn
+
+
+class ConnectionPool:
+    """LIFO pool of idle connections to one database in one mode.
+
+    A connection is handed to exactly one thread at a time, so the
+    per-connection statement cache stays warm across requests.
+    """
+
+    def __init__(self, name, readonly=False, max_idle=MAX_IDLE):
+        self.name = name
+        self.path = DATABASES[name]
+        self.readonly = readonly
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.name, self.readonly)
+
+    def release(self, conn):
+        if getattr(conn, "path", self.path) != self.path:
+            conn.close()        # checked out before configure() moved this database
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def _pool(name, readonly):
+    key = (name, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(name, readonly))
+    return pool
+
+
+def get_db(name="main", readonly=False):
+    """Connection for the current request (or thread, outside a request).
+
+    Inside an app context the connection is checked out of the pool once and
+    returned at teardown, so callers must not close it.
+    """
+    key = (name, readonly)
+    if has_app_context():
+        conns = g.setdefault("_db_conns", {})
+        conn = conns.get(key)
+        if conn is None:
+            conn = conns[key] = _pool(name, readonly).acquire()
+        return conn
+
+    # Background threads and scripts keep one connection per thread
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = connect(name, readonly)
+    return conn
+
+
+def get_db_connection():
+    """Backwards-compatible alias for the main database connection."""
+    return get_db("main")
+
+
+def release_request_connections(exception=None):
+    """Return the request's connections to their pools."""
+    conns = g.pop("_db_conns", None) if has_app_context() else None
+    for (name, readonly), conn in (conns or {}).items():
+        _pool(name, readonly).release(conn)
+
+
+def _forget_connections():
+    # SQLite handles must not cross fork(); the child starts with empty pools
+    # and leaves the parent's connections for the parent to close.
+    global _pools_lock, _local
+    _pools.clear()
+    _pools_lock = threading.Lock()
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_connections)
+
+
+_paths_fixed = False
+
+
+def configure(**paths):
+    """Point logical database names at other files (tests, benchmarks).
+
+    Only before an app is built: the pools and the in-memory boards,
+    caches and catalogs built from these files are per process, so a
+    second app on other files would see the first one's data.
+    """
+    changed = {name: path for name, path in paths.items() if DATABASES.get(name) != path}
+    if not changed:
+        return
+    if _paths_fixed:
+        raise RuntimeError("database paths are fixed once an app is built in this process "
+                           "(changing %s)" % ", ".join(sorted(changed)))
+    DATABASES.update(changed)
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+def init_app(app):
+    global _paths_fixed
+    _paths_fixed = True
+    app.teardown_appcontext(release_request_connections)
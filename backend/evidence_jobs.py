@@ -0,0 +1,324 @@
+# evidence_jobs.py
+import atexit, hashlib, json, logging, os, random, socket, struct, threading, time, zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+
+from db import get_db
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_BASE = 2.0          # seconds; retry n waits BACKOFF_BASE ** n (+ jitter)
+LEASE_SECONDS = 300         # a running job older than this is presumed lost
+POLL_INTERVAL = 1.0
+CHUNK_SIZE = 64 * 1024
+
+# (magic prefix, detected type, mime)
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"\xff\xd8\xff", "jpeg", "image/jpeg"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+    (b"%PDF-", "pdf", "application/pdf"),
+    (b"PK\x03\x04", "zip", "application/zip"),
+    (b"MZ", "pe", "application/x-msdownload"),
+    (b"\x7fELF", "elf", "application/x-executable"),
+    (b"\x1f\x8b", "gzip", "application/gzip"),
+)
+EXECUTABLE_TYPES = {"pe", "elf"}
+
+
+# -------------------- Processing (runs in the worker pool) --------------------
+def sniff_type(head):
+    for magic, kind, mime in SIGNATURES:
+        if head.startswith(magic):
+            return kind, mime
+    try:
+        head.decode("utf-8")
+        return "text", "text/plain"
+    except UnicodeDecodeError:
+        return "binary", "application/octet-stream"
+
+
+def image_size(path, kind):
+    """(width, height) for PNG/GIF/JPEG without decoding the image."""
+    with open(path, "rb") as f:
+        if kind == "png":
+            f.seek(16)
+            return struct.unpack(">II", f.read(8))
+        if kind == "gif":
+            f.seek(6)
+            return struct.unpack("<HH", f.read(4))
+        if kind == "jpeg":
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                length = struct.unpack(">H", f.read(2))[0]
+                if marker[1] in (0xC0, 0xC1, 0xC2):
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+
+def process_evidence(path, expected_sha256, declared_mime):
+    """Hash, sniff and extract metadata from one stored blob."""
+    digest, size = hashlib.sha256(), 0
+    with open(path, "rb") as f:
+        head = f.read(512)
+        f.seek(0)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    sha256 = digest.hexdigest()
+    if sha256 != expected_sha256:
+        raise ValueError("content hash mismatch: stored blob is corrupt")
+
+    kind, mime = sniff_type(head)
+    meta = {
+        "sha256": sha256,
+        "size": size,
+        "detected_type": kind,
+        "detected_mime": mime,
+        "mime_mismatch": bool(declared_mime) and declared_mime != mime and kind not in ("text", "binary"),
+        "executable": kind in EXECUTABLE_TYPES,
+    }
+    if kind in ("png", "gif", "jpeg"):
+        dims = image_size(path, kind)
+        if dims:
+            meta["width"], meta["height"] = dims
+    elif kind == "pdf":
+        meta["pdf_version"] = head[5:8].decode("ascii", "replace")
+    elif kind == "zip":
+        try:
+            with zipfile.ZipFile(path) as zf:
+                names = zf.namelist()
+            meta["zip_entries"] = len(names)
+            meta["zip_executables"] = [n for n in names if n.lower().endswith((".exe", ".scr", ".bat", ".js"))][:20]
+        except zipfile.BadZipFile:
+            meta["zip_entries"] = None
+    return meta
+
+
+# -------------------- Queue --------------------
+class JobQueue:
+    """SQLite-backed evidence processing queue with a worker pool.
+
+    A dispatcher thread claims due jobs (atomically, so several app
+    processes can share one database) and hands them to a thread or
+    process pool. Failures are retried with exponential backoff; jobs left
+    'running' by a dead process are re-queued when the queue starts.
+    """
+
+    def __init__(self, blob_path, workers=DEFAULT_WORKERS, mode="thread",
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=POLL_INTERVAL):
+        self.blob_path = blob_path
+        self.workers = workers
+        self.mode = mode
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.owner = "%s:%d" % (socket.gethostname(), os.getpid())
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._inflight = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+
+    # --- Producer side ---
+    def enqueue(self, conn, evidence_id):
+        now = time.time()
+        cur = conn.execute(
+            "INSERT INTO evidence_jobs (evidence_id, status, attempts, max_attempts, next_run_at, created_at, updated_at) "
+            "VALUES (?, 'queued', 0, ?, ?, ?, ?)",
+            (evidence_id, self.max_attempts, now, now, now),
+        )
+        conn.commit()
+        self._wake.set()
+        return cur.lastrowid
+
+    # --- Lifecycle ---
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.owner = "%s:%d" % (socket.gethostname(), os.getpid())
+            self.recover()
+            pool = ProcessPoolExecutor if self.mode == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.workers)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="evidence-dispatcher", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, wait=True):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def recover(self):
+        """Re-queue jobs whose worker died mid-flight."""
+        conn = get_db()
+        host = socket.gethostname()
+        now = time.time()
+        lost = []
+        for row in conn.execute("SELECT id, owner, claimed_at FROM evidence_jobs WHERE status='running'"):
+            owner_host, _, pid = (row["owner"] or "").partition(":")
+            if (row["claimed_at"] or 0) < now - LEASE_SECONDS:
+                lost.append(row["id"])
+            elif owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                lost.append(row["id"])
+        if lost:
+            conn.executemany(
+                "UPDATE evidence_jobs SET status='queued', next_run_at=?, owner=NULL, updated_at=? "
+                "WHERE id=? AND status='running'",
+                [(now, now, job_id) for job_id in lost],
+            )
+            conn.commit()
+            log.warning("re-queued %d evidence job(s) left running by a dead worker", len(lost))
+        return lost
+
+    # --- Dispatcher ---
+    def _claim(self, limit):
+        now = time.time()
+        conn = get_db()
+        rows = conn.execute(
+            "UPDATE evidence_jobs SET status='running', attempts=attempts+1, owner=?, claimed_at=?, updated_at=? "
+            "WHERE id IN (SELECT id FROM evidence_jobs WHERE status='queued' AND next_run_at<=? "
+            "ORDER BY next_run_at LIMIT ?) "
+            "RETURNING id, evidence_id, attempts, max_attempts",
+            (self.owner, now, now, now, limit),
+        ).fetchall()
+        conn.commit()
+        jobs = []
+        for row in rows:
+            ev = conn.execute("SELECT sha256, mime FROM evidence WHERE id=?", (row["evidence_id"],)).fetchone()
+            jobs.append((dict(row), ev))
+        return jobs
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while not self._stop.is_set():
+            free = 0
+            while self._inflight.acquire(blocking=False):
+                free += 1
+            try:
+                jobs = self._claim(free) if free else []
+            except Exception:
+                log.exception("claiming evidence jobs failed")
+                jobs = []
+            for _ in range(free - len(jobs)):
+                self._inflight.release()
+
+            for job, ev in jobs:
+                if ev is None:
+                    self._finish(job, error="evidence row no longer exists", retry=False)
+                    self._inflight.release()
+                    continue
+                future = self._executor.submit(
+                    process_evidence, self.blob_path(ev["sha256"]), ev["sha256"], ev["mime"]
+                )
+                future.add_done_callback(lambda f, job=job: self._done(job, f))
+
+            if time.monotonic() - last_sweep > LEASE_SECONDS:
+                last_sweep = time.monotonic()
+                try:
+                    self.recover()
+                except Exception:
+                    log.exception("recovering evidence jobs failed")
+
+            if not jobs:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _done(self, job, future):
+        try:
+            error = future.exception()
+            if error is None:
+                self._finish(job, result=future.result())
+            else:
+                self._finish(job, error="%s: %s" % (type(error).__name__, error))
+        except Exception:
+            log.exception("recording evidence job %s failed", job["id"])
+        finally:
+            self._inflight.release()
+            self._wake.set()
+
+    def _finish(self, job, result=None, error=None, retry=True):
+        now = time.time()
+        conn = get_db()
+        if error is None:
+            conn.execute(
+                "UPDATE evidence_jobs SET status='done', result=?, last_error=NULL, owner=NULL, updated_at=? WHERE id=?",
+                (json.dumps(result), now, job["id"]),
+            )
+        elif retry and job["attempts"] < job["max_attempts"]:
+            delay = BACKOFF_BASE ** job["attempts"] * (1 + random.random() / 2)
+            conn.execute(
+                "UPDATE evidence_jobs SET status='queued', next_run_at=?, last_error=?, owner=NULL, updated_at=? WHERE id=?",
+                (now + delay, error, now, job["id"]),
+            )
+        else:
+            conn.execute(
+                "UPDATE evidence_jobs SET status='failed', last_error=?, owner=NULL, updated_at=? WHERE id=?",
+                (error, now, job["id"]),
+            )
+        conn.commit()
+
+    # --- Status ---
+    @staticmethod
+    def status(conn, evidence_id):
+        row = conn.execute(
+            "SELECT status, attempts, last_error, result, updated_at FROM evidence_jobs "
+            "WHERE evidence_id=? ORDER BY id DESC LIMIT 1",
+            (evidence_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "error": row["last_error"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_queue():
+    return current_app.extensions["evidence_jobs"]
+
+
+def init_app(app, blob_path):
+    queue = JobQueue(
+        blob_path,
+        workers=int(app.config.get("EVIDENCE_WORKERS", DEFAULT_WORKERS)),
+        mode=app.config.get("EVIDENCE_WORKER_MODE", "thread"),
+        max_attempts=int(app.config.get("EVIDENCE_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+    )
+    app.extensions["evidence_jobs"] = queue
+
+    # Start lazily in the serving process (after any fork), not at import
+    @app.before_request
+    def start_evidence_workers():
+        if queue._thread is None:
+            queue.start()
+
+    return queue
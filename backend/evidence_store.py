@@ -0,0 +1,127 @@
+# evidence_store.py
+import datetime, hashlib, os, re, tempfile
+
+from flask import current_app
+
+from db import get_db
+
+CHUNK_SIZE = 64 * 1024
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class EvidenceStore:
+    """Content-addressed blob store for uploaded evidence.
+
+    Uploads are streamed to disk in fixed-size chunks while their SHA-256 is
+    computed, so memory use does not grow with file size. Each distinct
+    content is stored once under blobs/<aa>/<sha256>; every upload gets its
+    own metadata row in `evidence` and bumps the blob's refcount.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def ensure_dirs(self):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def save(self, stream, uploader_id, original_name, mime):
+        """Stream `stream` into the store. Returns the new evidence row."""
+        self.ensure_dirs()
+        digest, size = hashlib.sha256(), 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            now = datetime.datetime.utcnow().isoformat()
+
+            conn = get_db()
+            # The write lock serialises blob creation against release()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO evidence_blobs (sha256, size, refcount, created_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+                    (sha256, size, now),
+                )
+                final_path = self.blob_path(sha256)
+                if os.path.exists(final_path):
+                    os.unlink(tmp_path)       # duplicate content: keep the existing blob
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                cur = conn.execute(
+                    "INSERT INTO evidence (sha256, uploader_id, original_name, size, mime, uploaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (sha256, uploader_id, original_name, size, mime, now),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return self.get(cur.lastrowid)
+
+    def get(self, evidence_id):
+        return get_db().execute("SELECT * FROM evidence WHERE id=?", (evidence_id,)).fetchone()
+
+    def find_by_hash(self, sha256):
+        """Most recent upload of this content, or None."""
+        if not SHA256_RE.match(sha256):
+            return None
+        return get_db().execute(
+            "SELECT * FROM evidence WHERE sha256=? ORDER BY id DESC LIMIT 1", (sha256,)
+        ).fetchone()
+
+    def list_for_user(self, uploader_id, limit=20):
+        return get_db().execute(
+            "SELECT * FROM evidence WHERE uploader_id=? ORDER BY id DESC LIMIT ?",
+            (uploader_id, limit),
+        ).fetchall()
+
+    def release(self, evidence_id):
+        """Delete one upload; the blob goes when its last reference does."""
+        conn = get_db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT sha256 FROM evidence WHERE id=?", (evidence_id,)).fetchone()
+            if row is None:
+                conn.rollback()
+                return False
+            # A job still running for it finds the row gone and records nothing
+            conn.execute("DELETE FROM evidence_jobs WHERE evidence_id=?", (evidence_id,))
+            conn.execute("DELETE FROM evidence WHERE id=?", (evidence_id,))
+            conn.execute("UPDATE evidence_blobs SET refcount = refcount - 1 WHERE sha256=?", (row["sha256"],))
+            orphan = conn.execute(
+                "DELETE FROM evidence_blobs WHERE sha256=? AND refcount <= 0", (row["sha256"],)
+            ).rowcount
+            if orphan and os.path.exists(self.blob_path(row["sha256"])):
+                os.unlink(self.blob_path(row["sha256"]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
+
+
+def get_store():
+    return current_app.extensions["evidence_store"]
+
+
+def init_app(app):
+    store = app.extensions["evidence_store"] = EvidenceStore(app.config["UPLOAD_FOLDER"])
+    return store
@@ -0,0 +1,45 @@
+# file_serving.py
+import hashlib, os, threading
+
+from flask import send_file
+
+CHUNK_SIZE = 64 * 1024
+ONE_YEAR = 365 * 24 * 3600
+
+_hashes = {}            # path -> (mtime_ns, size, sha256)
+_hashes_lock = threading.Lock()
+
+
+def content_hash(path):
+    """SHA-256 of a file, recomputed only when its mtime or size changes."""
+    st = os.stat(path)
+    cached = _hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    with _hashes_lock:
+        _hashes[path] = (st.st_mtime_ns, st.st_size, sha256)
+    return sha256
+
+
+def send_validated_file(path, etag=None, immutable=False, **kwargs):
+    """send_file with a strong content ETag, 304s and Range support.
+
+    werkzeug answers If-None-Match / If-Modified-Since with 304 and Range
+    with 206 when `conditional` is on. The body goes out through
+    wsgi.file_wrapper (sendfile under gunicorn/uWSGI), or as an
+    X-Sendfile header when USE_X_SENDFILE is enabled behind nginx/Apache.
+    """
+    resp = send_file(path, etag=etag or content_hash(path), conditional=True, **kwargs)
+    if immutable:
+        # Content-addressed URLs never change meaning
+        resp.cache_control.no_cache = None
+        resp.cache_control.max_age = ONE_YEAR
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+    return resp
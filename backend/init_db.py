@@ -1,24 +1,16 @@
 import sqlite3
 from werkzeug.security import generate_password_hash
-import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "database.db")
+from db import connect, DB_PATH
+from migrations import migrate_all
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    # Schema lives in migrations.py; this script only adds the demo account
+    for name, versions in migrate_all().items():
+        print("%s: applied %s" % (name, versions or "nothing (up to date)"))
 
-    # Create users table with desired columns
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        points INTEGER DEFAULT 0,
-        badge TEXT DEFAULT 'Newbie'
-    )
-    """)
+    conn = connect("main")
+    c = conn.cursor()
 
     # Insert demo user (if not exists)
     demo_email = "test@example.com"
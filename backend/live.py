@@ -0,0 +1,357 @@
+# live.py
+import collections, json, logging, os, secrets, sqlite3, sys, threading, time
+
+from flask import Response, current_app, request
+
+from db import get_db
+from write_behind import get_writer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TICK = 0.5          # seconds; changes inside one tick go out as one event
+DEFAULT_HEARTBEAT = 15.0    # comment line on idle streams so proxies and dead clients are noticed
+DEFAULT_MAX_STREAMS = 500
+DEFAULT_HISTORY = 64        # events kept per topic for Last-Event-ID catch-up
+DEFAULT_SYNC = 1.0          # seconds between checks for other workers' changes
+RETRY_MS = 3000
+
+# Topics are "<kind>:<detail>", e.g. "leaderboard:weekly". A renderer is
+# registered per kind and called as fn(topic, changed) where `changed` is
+# the set of keys published since the last tick, or None for a full
+# snapshot; it returns a JSON-able payload.
+_renderers = {}
+_refreshers = {}
+
+# Bumped once per shared publish; other workers' hubs poll the counters
+BUMP_SQL = ("INSERT INTO live_versions (topic, version) VALUES (?, 1) "
+            "ON CONFLICT(topic) DO UPDATE SET version = version + 1")
+
+
+def renderer(kind):
+    """Register the function that turns a topic's changes into an event."""
+    def register(fn):
+        _renderers[kind] = fn
+        return fn
+    return register
+
+
+def refresher(kind):
+    """Register fn(topic), called when another worker changed the topic.
+
+    It should drop whatever this process cached for the topic, so the
+    next render reads what the other worker wrote.
+    """
+    def register(fn):
+        _refreshers[kind] = fn
+        return fn
+    return register
+
+
+def _render(topic, changed):
+    return _renderers[topic.split(":", 1)[0]](topic, changed)
+
+
+class _Topic:
+    __slots__ = ("name", "cond", "events", "floor", "dirty", "subscribers", "snapshot")
+
+    def __init__(self, name):
+        self.name = name
+        self.cond = threading.Condition()
+        self.events = collections.deque()   # (seq, encoded event)
+        self.floor = 0          # a client must have seen this seq for catch-up to be exact
+        self.dirty = set()
+        self.subscribers = 0
+        self.snapshot = None    # (seq, encoded snapshot) valid until the next event
+
+
+class EventHub:
+    """Server-Sent Events fan-out with per-tick coalescing.
+
+    Request handlers `publish(topic, key)`; that only records the key. A
+    ticker thread wakes every `tick` seconds, renders one event per dirty
+    topic from all keys gathered since the last tick, encodes it once and
+    wakes that topic's streams, which write the same bytes. So the cost of
+    a change is one render however many viewers are connected.
+
+    Event ids are "<epoch>-<seq>": a reconnecting client's Last-Event-ID is
+    answered with the events it missed if they are still in the topic's
+    history, otherwise with a fresh snapshot.
+
+    The hub is per process. A shared publish also bumps the topic's row
+    in live_versions, queued behind the request's own writes. Every
+    `sync` seconds each hub reads those counters. A topic moved by
+    another worker is refreshed (its cached board dropped) and
+    re-rendered, so viewers on any worker see every worker's changes
+    within about sync + tick seconds.
+
+    Each open stream holds a server thread (or greenlet), so at most
+    `max_streams` are accepted, and none on a server without threads to
+    spare (see streaming_supported); the endpoint then answers 503 and
+    pages fall back to polling.
+    """
+
+    def __init__(self, tick=DEFAULT_TICK, heartbeat=DEFAULT_HEARTBEAT,
+                 max_streams=DEFAULT_MAX_STREAMS, history=DEFAULT_HISTORY, sync=DEFAULT_SYNC):
+        self.tick = tick
+        self.sync = sync
+        self.heartbeat = heartbeat
+        self.max_streams = max_streams
+        self.history = history
+        self._topics = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._streams = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.epoch = None
+        self._versions = None       # topic -> live_versions.version last read
+        self._own = {}              # topic -> bumps queued by this process, not yet read back
+        self._synced_at = 0.0
+
+    # --- Producer side ---
+    def publish(self, topic, key=None, share=True):
+        """Note that `key` changed in `topic`; viewers hear about it next tick.
+
+        With `share`, other workers are told too. That needs a request
+        context and comes after the request's write-behind writes. Pass
+        share=False when the data reaches the database some other way and
+        that path bumps the topic itself (contest snapshots do).
+        """
+        self._ensure_started()
+        t = self._topic(topic)
+        with t.cond:
+            t.dirty.add(key)
+        if share:
+            get_writer().write((BUMP_SQL, (topic,)))
+            with self._lock:
+                self._own[topic] = self._own.get(topic, 0) + 1
+
+    def _topic(self, name):
+        t = self._topics.get(name)
+        if t is None:
+            with self._lock:
+                t = self._topics.setdefault(name, _Topic(name))
+        return t
+
+    def _next_seq(self):
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    # --- Ticker ---
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # A forked worker starts its own sequence, so ids from another process never match
+                self._pid = os.getpid()
+                self.epoch = secrets.token_hex(4)
+                self._seq = 0
+                self._topics = {}
+                self._streams = 0
+                self._versions, self._own = self._read_versions(), {}
+                self._thread = threading.Thread(target=self._run, name="event-hub", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            if time.monotonic() - self._synced_at >= self.sync:
+                self._synced_at = time.monotonic()
+                self._sync()
+            for t in list(self._topics.values()):
+                if t.dirty:
+                    self._flush(t)
+
+    @staticmethod
+    def _read_versions():
+        try:
+            return dict(get_db(readonly=True).execute("SELECT topic, version FROM live_versions").fetchall())
+        except sqlite3.Error:
+            log.exception("reading live_versions failed")
+            return None
+
+    def _sync(self):
+        """Mark topics dirty that another worker changed since the last read."""
+        versions = self._read_versions()
+        if versions is None:
+            return
+        seen, self._versions = self._versions, versions
+        if seen is None:
+            # No baseline from start-up: our queued bumps may already be counted
+            with self._lock:
+                self._own = {}
+            return
+        for topic, version in versions.items():
+            delta = version - seen.get(topic, 0)
+            if not delta:
+                continue
+            with self._lock:
+                own = self._own.get(topic, 0)
+                self._own[topic] = max(0, own - delta)
+            if delta <= own:
+                continue    # only our own bumps
+            fn = _refreshers.get(topic.split(":", 1)[0])
+            if fn is not None:
+                try:
+                    fn(topic)
+                except Exception:
+                    log.exception("refreshing %s failed", topic)
+            t = self._topics.get(topic)
+            if t is not None:
+                with t.cond:
+                    t.dirty.add(None)
+
+    def _flush(self, t):
+        with t.cond:
+            changed, t.dirty = t.dirty, set()
+            if not t.subscribers:
+                # Nobody to tell: skip the render and make later resumes start from a snapshot
+                t.events.clear()
+                t.snapshot = None
+                t.floor = self._next_seq()
+                return
+        changed.discard(None)      # publishes without a key, other workers' changes
+        try:
+            payload = _render(t.name, changed)
+        except Exception:
+            log.exception("rendering %s failed", t.name)
+            return
+        seq = self._next_seq()
+        data = self.encode(seq, "update", payload)
+        with t.cond:
+            t.events.append((seq, data))
+            while len(t.events) > self.history:
+                t.floor = t.events.popleft()[0]
+            t.snapshot = None
+            t.cond.notify_all()
+
+    def stop(self):
+        self._stop.set()
+        for t in list(self._topics.values()):
+            with t.cond:
+                t.cond.notify_all()
+
+    # --- Consumer side ---
+    def encode(self, seq, event, payload):
+        return ("id: %s-%d\nevent: %s\ndata: %s\n\n" % (
+            self.epoch, seq, event, json.dumps(payload, separators=(",", ":")))).encode()
+
+    def _resume_point(self, t, last_event_id):
+        """Seq to replay after, or None when the client needs a snapshot."""
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq >= t.floor else None
+
+    def _snapshot(self, t):
+        with t.cond:
+            cached = t.snapshot
+            latest = t.events[-1][0] if t.events else t.floor
+        if cached is not None and cached[0] == latest:
+            return cached
+        data = self.encode(latest, "snapshot", _render(t.name, None))
+        with t.cond:
+            if (t.events[-1][0] if t.events else t.floor) == latest:
+                t.snapshot = (latest, data)
+        return latest, data
+
+    def open_stream(self, topic, last_event_id=None):
+        """A streaming Response for one viewer, or None when at capacity or unsupported."""
+        if not streaming_supported():
+            return None
+        self._ensure_started()
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+        t = self._topic(topic)
+        with t.cond:
+            t.subscribers += 1
+        closed = []
+
+        def release():
+            if closed:
+                return
+            closed.append(True)
+            with t.cond:
+                t.subscribers -= 1
+            with self._lock:
+                self._streams -= 1
+
+        try:
+            # Resolved here, inside the request, so a snapshot render uses the request's connection
+            after = self._resume_point(t, last_event_id)
+            first = None
+            if after is None:
+                after, first = self._snapshot(t)
+        except Exception:
+            release()
+            raise
+
+        resp = Response(self._events(t, after, first), mimetype="text/event-stream")
+        resp.call_on_close(release)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"    # nginx: don't buffer the stream
+        return resp
+
+    def _events(self, t, after, first):
+        yield ("retry: %d\n\n" % RETRY_MS).encode()
+        if first is not None:
+            yield first
+        while not self._stop.is_set():
+            with t.cond:
+                pending = [item for item in t.events if item[0] > after]
+                if not pending:
+                    t.cond.wait(self.heartbeat)
+                    pending = [item for item in t.events if item[0] > after]
+                fell_behind = after < t.floor
+            if fell_behind:
+                # Slower than `history` events: skip ahead rather than replay a gap
+                after, data = self._snapshot(t)
+                yield data
+            elif pending:
+                after = pending[-1][0]
+                yield b"".join(data for _, data in pending)
+            else:
+                yield b": ping\n\n"
+
+
+def streaming_supported():
+    """Whether this server can park a stream without blocking other requests.
+
+    A sync pre-fork worker (gunicorn's default) serves one request at a
+    time, so an open stream would pin the whole process until the worker
+    timeout. Threaded servers (gthread, the dev server) and greenlet ones
+    (gevent, eventlet) are fine. LIVE_STREAMS = "on" / "off" overrides.
+    """
+    mode = current_app.config.get("LIVE_STREAMS", "auto")
+    if mode in ("on", "off"):
+        return mode == "on"
+    environ = request.environ
+    if environ.get("wsgi.multithread") or "gevent" in sys.modules or "eventlet" in sys.modules:
+        return True
+    return not environ.get("wsgi.multiprocess") and not environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")
+
+
+def get_hub():
+    return current_app.extensions["live"]
+
+
+def init_app(app):
+    """LIVE_TICK_MS, LIVE_HEARTBEAT, LIVE_MAX_STREAMS and LIVE_SYNC_MS tune the hub.
+
+    Under gunicorn -k gthread keep LIVE_MAX_STREAMS below --threads, or the
+    streams take every thread a worker has.
+    """
+    hub = EventHub(
+        tick=float(app.config.get("LIVE_TICK_MS", DEFAULT_TICK * 1000)) / 1000,
+        heartbeat=float(app.config.get("LIVE_HEARTBEAT", DEFAULT_HEARTBEAT)),
+        max_streams=int(app.config.get("LIVE_MAX_STREAMS", DEFAULT_MAX_STREAMS)),
+        sync=float(app.config.get("LIVE_SYNC_MS", DEFAULT_SYNC * 1000)) / 1000,
+    )
+    app.extensions["live"] = hub
+    app.jinja_env.globals["live_streams"] = streaming_supported
+    return hub
@@ -0,0 +1,198 @@
+# metrics.py
+import bisect, threading, time, weakref
+
+from flask import Response, g, request
+
+import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+MAX_LIVE_SHARDS = 64        # past this, shards of finished threads are folded together
+PREFIX = "cybercase_"
+
+
+class _Shard:
+    """Counters written by exactly one thread, so updates need no lock."""
+
+    __slots__ = ("counters", "histograms", "in_flight", "db_time")
+
+    def __init__(self):
+        self.counters = {}      # (name, labels) -> number
+        self.histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+        self.in_flight = 0
+        self.db_time = 0.0
+
+    def merge_into(self, other):
+        for key, value in list(self.counters.items()):
+            other.counters[key] = other.counters.get(key, 0) + value
+        for key, hist in list(self.histograms.items()):
+            mine = other.histograms.get(key)
+            if mine is None:
+                other.histograms[key] = list(hist)
+            else:
+                for i, value in enumerate(hist):
+                    mine[i] += value
+        other.in_flight += self.in_flight
+
+
+class Registry:
+    """Per-thread metric shards, summed only when /metrics is scraped.
+
+    The hot path touches only the calling thread's shard: a dict lookup
+    and a few integer adds. Shards of threads that have exited (the
+    threaded dev server uses one thread per request) are folded into a
+    retired shard so the list stays short.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []           # (weakref to thread, shard)
+        self._retired = _Shard()
+
+    def shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                if len(self._shards) >= MAX_LIVE_SHARDS:
+                    self._compact()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _compact(self):
+        live = []
+        for ref, shard in self._shards:
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                shard.merge_into(self._retired)
+            else:
+                live.append((ref, shard))
+        self._shards = live
+
+    def inc(self, name, labels, amount=1):
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        histograms = self.shard().histograms
+        key = (name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = [0] * (len(buckets) + 3)
+        hist[bisect.bisect_left(buckets, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def snapshot(self):
+        total = _Shard()
+        with self._lock:
+            self._compact()
+            self._retired.merge_into(total)
+            for _, shard in self._shards:
+                shard.merge_into(total)
+        return total
+
+
+# -------------------- Exposition --------------------
+def _labels(pairs, extra=None):
+    items = list(pairs) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+
+
+METRIC_HELP = {
+    "http_requests_total": ("counter", "Requests by endpoint, method and status"),
+    "http_request_duration_seconds": ("histogram", "Request latency"),
+    "http_response_size_bytes": ("histogram", "Response body size"),
+    "db_time_seconds": ("histogram", "Time spent in SQLite per request"),
+}
+BUCKETS = {
+    "http_request_duration_seconds": LATENCY_BUCKETS,
+    "http_response_size_bytes": SIZE_BUCKETS,
+    "db_time_seconds": DB_BUCKETS,
+}
+
+
+def render(registry):
+    """Prometheus text exposition format, version 0.0.4."""
+    snap = registry.snapshot()
+    lines = []
+    for name, (kind, help_text) in METRIC_HELP.items():
+        full = PREFIX + name
+        lines.append("# HELP %s %s" % (full, help_text))
+        lines.append("# TYPE %s %s" % (full, kind))
+        if kind == "counter":
+            for (metric, labels), value in sorted(snap.counters.items()):
+                if metric == name:
+                    lines.append("%s%s %s" % (full, _labels(labels), value))
+            continue
+        bounds = BUCKETS[name]
+        for (metric, labels), hist in sorted(snap.histograms.items()):
+            if metric != name:
+                continue
+            running = 0
+            for bound, count in zip(bounds + ("+Inf",), hist):
+                running += count
+                lines.append("%s_bucket%s %d" % (full, _labels(labels, ("le", bound)), running))
+            lines.append("%s_sum%s %r" % (full, _labels(labels), hist[-2]))
+            lines.append("%s_count%s %d" % (full, _labels(labels), hist[-1]))
+    lines.append("# HELP %shttp_requests_in_flight Requests being handled" % PREFIX)
+    lines.append("# TYPE %shttp_requests_in_flight gauge" % PREFIX)
+    lines.append("%shttp_requests_in_flight %d" % (PREFIX, snap.in_flight))
+    return "\n".join(lines) + "\n"
+
+
+# -------------------- Flask wiring --------------------
+def init_app(app):
+    """Instrument every request; METRICS=False leaves the app untouched."""
+    if not app.config.get("METRICS", True):
+        return None
+    registry = app.extensions["metrics"] = Registry()
+
+    def on_query(conn, sql, params, seconds, phase):
+        registry.shard().db_time += seconds
+
+    db.observe_queries(on_query, key="metrics")
+
+    @app.before_request
+    def start_timer():
+        shard = registry.shard()
+        shard.in_flight += 1
+        shard.db_time = 0.0
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_response(response):
+        g._metrics_status = response.status_code
+        # Streamed bodies (send_file, SSE) only know their Content-Length header;
+        # measuring a generator would consume it
+        size = response.content_length
+        if size is None and not response.is_streamed:
+            size = response.calculate_content_length()
+        g._metrics_size = size or 0
+        return response
+
+    @app.teardown_request
+    def finish_timer(exc=None):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        shard = registry.shard()
+        shard.in_flight -= 1
+        endpoint = request.endpoint or "unmatched"
+        status = g.pop("_metrics_status", 500)
+        labels = (("endpoint", endpoint), ("method", request.method))
+        registry.inc("http_requests_total", labels + (("status", status),))
+        registry.observe("http_request_duration_seconds", labels, time.perf_counter() - start, LATENCY_BUCKETS)
+        registry.observe("http_response_size_bytes", labels, g.pop("_metrics_size", 0), SIZE_BUCKETS)
+        registry.observe("db_time_seconds", labels, shard.db_time, DB_BUCKETS)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(render(registry), mimetype="text/plain; version=0.0.4")
+
+    return registry
@@ -0,0 +1,436 @@
+# migrations.py
+import base64, datetime, json
+
+from db import connect, DATABASES
+
+# Each database has an ordered list of (version, description, step).
+# A step is either SQL (one or more ;-separated statements) or a callable
+# taking the connection. Applied versions are recorded in schema_version,
+# so every step runs exactly once per database file.
+
+
+# -------------------- Helpers --------------------
+def run_sql(conn, sql):
+    """Execute ;-separated statements inside the current transaction."""
+    for statement in sql.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def add_missing_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for each (name, ddl) the table doesn't have yet."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(%s)" % table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, name, ddl))
+
+
+# -------------------- main (database.db) --------------------
+def main_baseline(conn):
+    # Older databases were created by three different scripts; converge them
+    run_sql(conn, """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS user_scores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        score INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'not cleared'
+    );
+    CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        score INTEGER,
+        total INTEGER,
+        time TEXT,
+        question_ids TEXT
+    )
+    """)
+    add_missing_columns(conn, "users", [
+        ("points", "INTEGER DEFAULT 0"),
+        ("badge", "TEXT DEFAULT 'Newbie'"),
+        ("last_score", "INTEGER DEFAULT 0"),
+        ("last_badge", "TEXT"),
+        ("last_attempt_time", "TEXT"),
+        ("last_questions", "TEXT"),
+    ])
+
+
+LEADERBOARD_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+    ON users(last_score DESC, last_attempt_time ASC, id, username, last_badge);
+CREATE INDEX IF NOT EXISTS idx_attempts_time
+    ON attempts(time, user_id, score, total)
+"""
+
+
+EVIDENCE_STORE = """
+CREATE TABLE IF NOT EXISTS evidence_blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS evidence (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL REFERENCES evidence_blobs(sha256),
+    uploader_id INTEGER,
+    original_name TEXT,
+    size INTEGER,
+    mime TEXT,
+    uploaded_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_evidence_sha256 ON evidence(sha256);
+CREATE INDEX IF NOT EXISTS idx_evidence_uploader ON evidence(uploader_id, id)
+"""
+
+
+EVIDENCE_JOBS = """
+CREATE TABLE IF NOT EXISTS evidence_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    evidence_id INTEGER NOT NULL REFERENCES evidence(id),
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at REAL,
+    owner TEXT,
+    claimed_at REAL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_evidence_jobs_due ON evidence_jobs(status, next_run_at);
+CREATE INDEX IF NOT EXISTS idx_evidence_jobs_evidence ON evidence_jobs(evidence_id, id)
+"""
+
+SESSIONS = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)
+"""
+
+
+def score_keys(conn):
+    """Merge duplicate user_scores rows, then make user_id unique."""
+    # Keep the oldest row per user, carrying over the best score and any clear
+    run_sql(conn, """
+    DELETE FROM user_scores WHERE user_id IS NULL;
+    UPDATE user_scores SET
+        score = (SELECT MAX(s.score) FROM user_scores s WHERE s.user_id = user_scores.user_id),
+        status = CASE WHEN EXISTS (SELECT 1 FROM user_scores s
+                                   WHERE s.user_id = user_scores.user_id AND s.status = 'cleared')
+                      THEN 'cleared' ELSE status END
+    WHERE id IN (SELECT MIN(id) FROM user_scores GROUP BY user_id HAVING COUNT(*) > 1);
+    DELETE FROM user_scores WHERE id NOT IN (SELECT MIN(id) FROM user_scores GROUP BY user_id);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_user_scores_user ON user_scores(user_id);
+    CREATE INDEX IF NOT EXISTS idx_attempts_user_time ON attempts(user_id, time)
+    """)
+
+
+USER_PROGRESS = """
+CREATE TABLE IF NOT EXISTS user_progress (
+    user_id INTEGER PRIMARY KEY,
+    quiz_attempts INTEGER NOT NULL DEFAULT 0,
+    quiz_best INTEGER NOT NULL DEFAULT 0,
+    quiz_last INTEGER,
+    quiz_last_badge TEXT,
+    quiz_last_time TEXT,
+    case1_status TEXT NOT NULL DEFAULT 'not started',
+    case2_score INTEGER NOT NULL DEFAULT 0,
+    case2_status TEXT NOT NULL DEFAULT 'not started',
+    drills_cleared INTEGER NOT NULL DEFAULT 0,
+    points INTEGER GENERATED ALWAYS AS (
+        quiz_best * 10
+        + CASE WHEN case1_status = 'cleared' THEN 100 ELSE 0 END
+        + case2_score * 50
+        + drills_cleared * 25
+    ) STORED
+);
+CREATE TABLE IF NOT EXISTS drill_clears (
+    user_id INTEGER NOT NULL,
+    level_id INTEGER NOT NULL,
+    cleared_at TEXT,
+    PRIMARY KEY (user_id, level_id)
+) WITHOUT ROWID
+"""
+
+
+def user_progress(conn):
+    """Create the per-user summary and fill it from existing attempts/scores."""
+    run_sql(conn, USER_PROGRESS)
+    run_sql(conn, """
+    INSERT OR IGNORE INTO user_progress (user_id) SELECT id FROM users;
+    UPDATE user_progress SET
+        quiz_attempts = (SELECT COUNT(*) FROM attempts a WHERE a.user_id = user_progress.user_id),
+        quiz_best = COALESCE((SELECT MAX(score) FROM attempts a WHERE a.user_id = user_progress.user_id), 0);
+    UPDATE user_progress SET
+        quiz_last = u.last_score, quiz_last_badge = u.last_badge, quiz_last_time = u.last_attempt_time
+    FROM users u WHERE u.id = user_progress.user_id AND u.last_attempt_time IS NOT NULL;
+    UPDATE user_progress SET case1_status = 'cleared'
+    WHERE user_id IN (SELECT user_id FROM user_scores WHERE status = 'cleared');
+    UPDATE user_progress SET case1_status = 'attempted'
+    WHERE case1_status = 'not started' AND user_id IN (SELECT user_id FROM user_scores)
+    """)
+
+
+def question_stats(conn):
+    """Per-answer outcomes, running per-question totals and learner ability."""
+    run_sql(conn, """
+    CREATE TABLE IF NOT EXISTS attempt_answers (
+        user_id INTEGER NOT NULL,
+        attempt_time TEXT NOT NULL,
+        question_id INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        time_ms INTEGER,
+        PRIMARY KEY (user_id, attempt_time, question_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS question_stats (
+        question_id INTEGER PRIMARY KEY,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        total_time_ms INTEGER NOT NULL DEFAULT 0,
+        timed INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # Old attempts kept only totals, so stats start empty
+    add_missing_columns(conn, "user_progress", [("quiz_ability", "REAL NOT NULL DEFAULT 0")])
+
+
+CONTESTS = """
+CREATE TABLE IF NOT EXISTS contests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    starts_at TEXT NOT NULL,
+    ends_at TEXT NOT NULL,
+    quiz_seconds INTEGER NOT NULL DEFAULT 90,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_contests_ends ON contests(ends_at);
+CREATE TABLE IF NOT EXISTS contest_challenges (
+    contest_id INTEGER NOT NULL,
+    challenge TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    PRIMARY KEY (contest_id, challenge)
+) WITHOUT ROWID;
+-- Snapshot of the in-memory scoreboard: best award per user and challenge
+CREATE TABLE IF NOT EXISTS contest_solves (
+    contest_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    challenge TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    solved_at TEXT NOT NULL,
+    PRIMARY KEY (contest_id, user_id, challenge)
+) WITHOUT ROWID
+"""
+
+
+RATE_LIMITS = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+LIVE_VERSIONS = """
+CREATE TABLE IF NOT EXISTS live_versions (
+    topic TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+
+# -------------------- usb_case (case/usb_case.db) --------------------
+USB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files(
+    id INTEGER PRIMARY KEY,
+    name TEXT, type TEXT, size INTEGER,
+    is_hidden INTEGER DEFAULT 0,
+    author TEXT, modified TEXT, notes TEXT,
+    is_malware INTEGER DEFAULT 0,
+    contains_sensitive INTEGER DEFAULT 0,
+    content TEXT,
+    path TEXT,
+    parent_id INTEGER REFERENCES files(id)
+);
+CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, val TEXT)
+"""
+
+
+def usb_seed(conn):
+    """Seed the demo USB drive if the files table is empty."""
+    if conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]:
+        return
+    now = datetime.datetime(2025, 8, 22, 10, 0, 0).isoformat()
+    files = [
+        dict(name="MeetingNotes.docx", type="docx", size=24, author="HR Department", modified=now,
+             notes="Weekly sync notes.", content="Agenda:\n- Hiring pipeline\n- Security awareness session\n- Lunch & Learn",
+             is_hidden=0, is_malware=0, contains_sensitive=0, path=None, parent_id=None),
+        dict(name="ProjectBudget.xlsx", type="xlsx", size=88, author="Admin", modified=now, notes="FY25 budget outline",
+             content="", is_hidden=0, is_malware=0, contains_sensitive=0, path=None, parent_id=None),
+        dict(name="Photos.zip", type="zip", size=512, author="Unknown", modified=now, notes="Compressed holiday photos",
+             content="", is_hidden=0, is_malware=0, contains_sensitive=0, path=None, parent_id=None),
+        dict(name="readme.txt", type="txt", size=2, author="Unknown", modified=now, notes="Plain text readme",
+             content="If found, please return to the front desk.", is_hidden=0, is_malware=0, contains_sensitive=0,
+             path=None, parent_id=None),
+        dict(name="report.pdf", type="pdf", size=140, author="Unknown", modified=now, notes="Quarterly CSR report",
+             content="", is_hidden=0, is_malware=0, contains_sensitive=0, path=None, parent_id=None),
+        dict(name="Invoice.pdf.exe", type="exe", size=620, author="—", modified=now,
+             notes="Looks like a PDF, but it's an executable.", content="", is_hidden=0, is_malware=1,
+             contains_sensitive=0, path=None, parent_id=None),
+        dict(name="confidential.txt", type="txt", size=4, author="—", modified=now, notes="Hidden file",
+             content="Top Secret Client List:\n- Acme Corp\n- Globex Inc\n- Initech\n[Leak Detected]",
+             is_hidden=1, is_malware=0, contains_sensitive=1, path=None, parent_id=None),
+    ]
+    insert = """
+        INSERT INTO files(name,type,size,author,modified,notes,content,is_hidden,is_malware,contains_sensitive,path,parent_id)
+        VALUES(:name,:type,:size,:author,:modified,:notes,:content,:is_hidden,:is_malware,:contains_sensitive,:path,:parent_id)
+    """
+    conn.executemany(insert, files)
+
+    # Photos.zip children
+    parent_id = conn.execute("SELECT id FROM files WHERE name='Photos.zip'").fetchone()[0]
+    images = [
+        dict(name="beach.jpg", type="img", size=220, author="Camera", modified=now, notes="", content="",
+             is_hidden=0, is_malware=0, contains_sensitive=0, path="images/beach.jpg", parent_id=parent_id),
+        dict(name="mountain.jpg", type="img", size=240, author="Camera", modified=now, notes="", content="",
+             is_hidden=0, is_malware=0, contains_sensitive=0, path="images/mountain.jpg", parent_id=parent_id),
+        dict(name="city.jpg", type="img", size=200, author="Camera", modified=now, notes="Check EXIF", content="",
+             is_hidden=0, is_malware=0, contains_sensitive=0, path="images/city.jpg", parent_id=parent_id),
+    ]
+    conn.executemany(insert, images)
+
+    # Fake EXIF data
+    secret = "Flag{USB_CASE_INTERMEDIATE}"
+    b64 = base64.b64encode(secret.encode()).decode()
+    conn.execute("INSERT OR REPLACE INTO settings(key,val) VALUES('exif_city', ?)", (json.dumps({
+        "Make": "CYBERCAM 1.0",
+        "Model": "Sim-EXIF",
+        "HiddenMessage": "true",
+        "UserComment": b64,
+        "Software": "PhotoDesk 3.2"
+    }),))
+
+
+# -------------------- challenges (cmd_module/challenges.db) --------------------
+LEVELS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS levels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    solution TEXT NOT NULL,
+    hint TEXT
+)
+"""
+
+
+def levels_seed(conn):
+    """Seed the sample drill levels if the table is empty."""
+    if conn.execute("SELECT COUNT(*) FROM levels").fetchone()[0]:
+        return
+    levels = [
+        (1, "Hello World", "Print the text hello world exactly as shown.", "Use echo with quoted text", 'echo "hello world"'),
+        (2, "Count Files", "Show the number of files (not directories) in the current directory.", "Use ls and wc -l", "ls -p | grep -v / | wc -l"),
+        (3, "Show First Line", "Print the first line of the file sample.txt (assume it exists).", "Use head or sed", "head -n 1 sample.txt"),
+        (4, "Find TODOs", "Recursively find lines containing TODO in the current directory.", "Use grep with -R -n", "grep -R -n TODO .")
+    ]
+    conn.executemany("INSERT INTO levels (id, title, description, hint, solution) VALUES (?, ?, ?, ?, ?)", levels)
+
+
+def levels_alternatives(conn):
+    """Extra accepted solutions, one per line, for commands with several idioms."""
+    add_missing_columns(conn, "levels", [("alternatives", "TEXT")])
+    alternatives = {
+        2: "find . -maxdepth 1 -type f | wc -l",
+        3: "sed -n 1p sample.txt\nsed -n '1p' sample.txt\nsed 1q sample.txt\nawk 'NR==1' sample.txt",
+        4: "grep -r -n TODO .",
+    }
+    for level_id, text in alternatives.items():
+        conn.execute("UPDATE levels SET alternatives=? WHERE id=? AND alternatives IS NULL", (text, level_id))
+
+
+MIGRATIONS = {
+    "main": [
+        (1, "users, user_scores and attempts baseline", main_baseline),
+        (2, "leaderboard covering indexes", LEADERBOARD_INDEXES),
+        (3, "content-addressed evidence store", EVIDENCE_STORE),
+        (4, "evidence processing job queue", EVIDENCE_JOBS),
+        (5, "server-side session store", SESSIONS),
+        (6, "unique user_scores.user_id and attempts(user_id, time)", score_keys),
+        (7, "denormalized per-user progress summary", user_progress),
+        (8, "per-question statistics and learner ability", question_stats),
+        (9, "timed contests and scoreboard snapshots", CONTESTS),
+        (10, "shared rate-limit token buckets", RATE_LIMITS),
+        (11, "live topic change counters shared by workers", LIVE_VERSIONS),
+    ],
+    "usb_case": [
+        (1, "files and settings tables", USB_SCHEMA),
+        (2, "seed demo USB drive", usb_seed),
+    ],
+    "challenges": [
+        (1, "levels table", LEVELS_SCHEMA),
+        (2, "seed sample levels", levels_seed),
+        (3, "accepted alternative solutions", levels_alternatives),
+    ],
+}
+
+
+# -------------------- Runner --------------------
+def migrate(name):
+    """Apply pending migrations to one database. Returns the versions applied."""
+    conn = connect(name)
+    applied = []
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )""")
+        done = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+        for version, description, step in MIGRATIONS[name]:
+            if version in done:
+                continue
+            # IMMEDIATE takes the write lock, so concurrent workers queue up here
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone():
+                    conn.rollback()
+                    continue
+                if callable(step):
+                    step(conn)
+                else:
+                    run_sql(conn, step)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.datetime.utcnow().isoformat()),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+    finally:
+        conn.close()
+    return applied
+
+
+def migrate_all():
+    """Bring every known database up to date. Returns {name: [versions]}."""
+    return {name: migrate(name) for name in MIGRATIONS if name in DATABASES}
+
+
+def init_app(app):
+    @app.cli.command("migrate")
+    def migrate_command():
+        """Apply pending schema migrations to every database."""
+        for name, versions in migrate_all().items():
+            print("%s: %s" % (name, ", ".join(map(str, versions)) if versions else "up to date"))
@@ -0,0 +1,126 @@
+# page_cache.py
+import collections, functools, hashlib, os, threading, time
+
+from flask import current_app, make_response, request, session
+
+DEFAULT_MAX_ENTRIES = 256
+CHECK_EVERY = 1.0           # seconds between template mtime scans
+
+
+class PageCache:
+    """Bounded LRU of rendered pages, dropped whenever a template changes.
+
+    Entries hold the encoded body and its strong ETag. Every template
+    directory is scanned at most once per CHECK_EVERY seconds; a newer
+    mtime than last time starts a new generation and empties the cache.
+    A deploy restarts the process, which starts with an empty cache.
+    """
+
+    def __init__(self, template_dirs, max_entries=DEFAULT_MAX_ENTRIES, check_every=CHECK_EVERY):
+        self.template_dirs = template_dirs
+        self.max_entries = max_entries
+        self.check_every = check_every
+        self._entries = collections.OrderedDict()   # key -> (etag, body)
+        self._lock = threading.Lock()
+        self._mtime = self._newest_mtime()
+        self._checked_at = time.monotonic()
+        self.hits = self.misses = 0
+
+    def _newest_mtime(self):
+        newest = 0
+        for root in self.template_dirs:
+            for dirpath, _, names in os.walk(root):
+                for name in names:
+                    newest = max(newest, os.stat(os.path.join(dirpath, name)).st_mtime_ns)
+        return newest
+
+    def _check_templates(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_every:
+            return
+        self._checked_at = now
+        mtime = self._newest_mtime()
+        if mtime != self._mtime:
+            with self._lock:
+                self._mtime = mtime
+                self._entries.clear()
+
+    def get(self, key):
+        self._check_templates()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body):
+        entry = (hashlib.sha256(body).hexdigest()[:32], body)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+def cached_response(key, render):
+    """Response for a page whose HTML is fully determined by `key`.
+
+    `render()` is called on a miss; anything but a str (a redirect, an
+    error) is returned as-is and not kept. The ETag is a hash of the body,
+    so a new template or asset URL after a deploy never gets a stale 304.
+    """
+    cache = current_app.extensions.get("page_cache")
+    entry = cache.get(key) if cache is not None else None
+    if entry is None:
+        body = render()
+        if not isinstance(body, str):
+            return body
+        body = body.encode("utf-8")
+        entry = cache.put(key, body) if cache is not None else (hashlib.sha256(body).hexdigest()[:32], body)
+    etag, body = entry
+    if etag in request.if_none_match:
+        resp = make_response("", 304)
+    else:
+        resp = make_response(body)
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def cached_page(view):
+    """Serve a GET page from the cache, with an ETag and 304 on If-None-Match.
+
+    Only for views whose HTML depends on nothing but the URL and whether
+    someone is logged in (base.html shows the nav bar then). Requests with
+    a flash message pending skip the cache, as that page is one-off.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or "_flashes" in session:
+            return view(*args, **kwargs)
+        key = (request.endpoint, tuple(sorted(kwargs.items())), request.query_string,
+               session.get("user_id") is not None)
+        return cached_response(key, lambda: view(*args, **kwargs))
+    return wrapper
+
+
+def init_app(app):
+    """PAGE_CACHE=False turns the cache off; PAGE_CACHE_SIZE bounds it."""
+    if not app.config.get("PAGE_CACHE", True):
+        return None
+    dirs = [os.path.join(app.root_path, app.template_folder)]
+    for bp in app.blueprints.values():
+        if bp.template_folder:
+            path = os.path.normpath(os.path.join(bp.root_path, bp.template_folder))
+            if os.path.isdir(path) and path not in dirs:
+                dirs.append(path)
+    cache = app.extensions["page_cache"] = PageCache(
+        dirs,
+        max_entries=int(app.config.get("PAGE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+        check_every=0 if app.debug else CHECK_EVERY,
+    )
+    return cache
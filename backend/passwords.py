@@ -0,0 +1,150 @@
+# passwords.py
+import atexit, os, threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DEFAULT_MAX_QUEUE = 32       # hashes queued or running before we fail fast
+DEFAULT_TIMEOUT = 10.0       # seconds a request waits for its hash
+BULK_CHUNK = 16
+
+
+class HasherBusy(Exception):
+    """The hashing pool is saturated; the caller should retry shortly."""
+
+
+def expand_method(method):
+    """The method as stored hashes spell it, e.g. "scrypt" -> "scrypt:32768:8:1".
+
+    Mirrors werkzeug's defaults, so no hash has to be computed to find out.
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return "scrypt:%d:%d:%d" % (n, r, p)
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return "pbkdf2:%s:%d" % (hash_name, iterations)
+    raise ValueError("unsupported password hash method %r" % method)
+
+
+# Module-level so a process pool can pickle them
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password):
+    return check_password_hash(stored, password)
+
+
+def _verify_many(pairs):
+    return [check_password_hash(stored, password) for stored, password in pairs]
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    Hashing is CPU-bound and holds the GIL, so doing it on the request
+    thread stalls every other request in the process. Here at most
+    `max_queue` hashes can be waiting or running; beyond that callers get
+    HasherBusy immediately instead of piling up. workers=0 hashes inline.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=DEFAULT_WORKERS,
+                 max_queue=DEFAULT_MAX_QUEUE, timeout=DEFAULT_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._executor = None
+        # Stored hashes start with the fully expanded method, e.g. "pbkdf2:sha256:600000"
+        self.method_prefix = expand_method(method)
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    atexit.register(self.shutdown)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is freed when the hash finishes, not when this caller stops
+        # waiting, so a timed-out hash still counts against max_queue
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()     # only succeeds if it hasn't started
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, stored, password):
+        return self._run(_verify, stored, password)
+
+    def needs_rehash(self, stored):
+        """True when `stored` was made with a different method or cost."""
+        return stored.split("$", 1)[0] != self.method_prefix
+
+    def verify_and_update(self, stored, password):
+        """Check a password; returns (ok, new_hash_or_None).
+
+        A new hash is produced only for a correct password whose stored
+        hash doesn't match the current cost policy.
+        """
+        if not self.verify(stored, password):
+            return False, None
+        if self.needs_rehash(stored):
+            return True, self.hash(password)
+        return True, None
+
+    def bulk_verify(self, pairs):
+        """Verify many (stored, password) pairs across the whole pool.
+
+        Bypasses the request queue limit; meant for benchmarks and batch jobs.
+        """
+        pairs = list(pairs)
+        if not self.workers:
+            return _verify_many(pairs)
+        chunks = [pairs[i:i + BULK_CHUNK] for i in range(0, len(pairs), BULK_CHUNK)]
+        results = []
+        for chunk_result in self._pool().map(_verify_many, chunks):
+            results.extend(chunk_result)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def get_hasher():
+    return current_app.extensions["passwords"]
+
+
+def init_app(app):
+    hasher = PasswordHasher(
+        method=app.config.get("PASSWORD_HASH_METHOD", DEFAULT_METHOD),
+        workers=int(app.config.get("PASSWORD_HASH_WORKERS", DEFAULT_WORKERS)),
+        max_queue=int(app.config.get("PASSWORD_HASH_QUEUE", DEFAULT_MAX_QUEUE)),
+        timeout=float(app.config.get("PASSWORD_HASH_TIMEOUT", DEFAULT_TIMEOUT)),
+    )
+    app.extensions["passwords"] = hasher
+    return hasher
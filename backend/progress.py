@@ -0,0 +1,65 @@
+# progress.py
+from db import get_db
+
+# Each scoring path queues one of these upserts next to its own writes, so
+# user_progress is kept current incrementally and /home reads a single row.
+# `points` is a generated column (see migrations.USER_PROGRESS).
+
+DEFAULTS = {
+    "quiz_attempts": 0, "quiz_best": 0, "quiz_last": None, "quiz_last_badge": None,
+    "quiz_last_time": None, "case1_status": "not started", "case2_score": 0,
+    "case2_status": "not started", "drills_cleared": 0, "points": 0, "quiz_ability": 0.0,
+}
+
+
+def quiz_op(user_id, score, badge, when):
+    return (
+        "INSERT INTO user_progress (user_id, quiz_attempts, quiz_best, quiz_last, quiz_last_badge, quiz_last_time) "
+        "VALUES (?, 1, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET quiz_attempts = quiz_attempts + 1, "
+        "quiz_best = MAX(quiz_best, excluded.quiz_best), quiz_last = excluded.quiz_last, "
+        "quiz_last_badge = excluded.quiz_last_badge, quiz_last_time = excluded.quiz_last_time",
+        (user_id, score, score, badge, when),
+    )
+
+
+def case1_op(user_id, cleared):
+    status = "cleared" if cleared else "attempted"
+    return (
+        "INSERT INTO user_progress (user_id, case1_status) VALUES (?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET case1_status = "
+        "CASE WHEN case1_status = 'cleared' THEN case1_status ELSE excluded.case1_status END",
+        (user_id, status),
+    )
+
+
+def case2_op(user_id, score, total=3):
+    status = "cleared" if score >= total else "attempted"
+    return (
+        "INSERT INTO user_progress (user_id, case2_score, case2_status) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET case2_score = MAX(case2_score, excluded.case2_score), "
+        "case2_status = CASE WHEN case2_status = 'cleared' THEN case2_status ELSE excluded.case2_status END",
+        (user_id, score, status),
+    )
+
+
+def drill_ops(user_id, level_id):
+    """Record a cleared drill; repeats don't count twice."""
+    return (
+        ("INSERT OR IGNORE INTO drill_clears (user_id, level_id, cleared_at) VALUES (?, ?, datetime('now'))",
+         (user_id, level_id)),
+        ("INSERT INTO user_progress (user_id, drills_cleared) "
+         "VALUES (?, (SELECT COUNT(*) FROM drill_clears WHERE user_id = ?)) "
+         "ON CONFLICT(user_id) DO UPDATE SET drills_cleared = excluded.drills_cleared",
+         (user_id, user_id)),
+    )
+
+
+def get_progress(user_id, conn=None):
+    """The user's summary row as a dict, with defaults for a brand-new user."""
+    conn = conn or get_db(readonly=True)
+    row = conn.execute("SELECT * FROM user_progress WHERE user_id = ?", (user_id,)).fetchone()
+    progress = dict(DEFAULTS, user_id=user_id)
+    if row is not None:
+        progress.update(dict(row))
+    return progress
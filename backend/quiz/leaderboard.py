@@ -0,0 +1,169 @@
+# quiz/leaderboard.py
+import datetime, threading, time
+
+from ranking import RankedList
+
+PAGE_SIZE = 20
+CACHE_TTL = 30  # seconds before an in-process board is reconciled with the DB
+PERIODS = ("all", "daily", "weekly")
+
+
+def badge_for(score, total):
+    """Badge earned for a quiz score."""
+    if score == total:
+        return "Cyber Hero"
+    elif score >= total * 0.75:
+        return "Cyber Defender"
+    elif score >= total * 0.5:
+        return "Cyber Learner"
+    return "Keep Practicing"
+
+
+def period_start(period, now=None):
+    """ISO timestamp where the current daily/weekly board begins (UTC)."""
+    now = now or datetime.datetime.utcnow()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "weekly":
+        start -= datetime.timedelta(days=start.weekday())
+    return start.isoformat()
+
+
+# --- Loaders (each one is a single index range scan) ---
+def load_overall(conn):
+    # Walks idx_users_leaderboard in order, so there is no sort step
+    return conn.execute(
+        "SELECT id AS user_id, username, last_score AS score, last_badge AS badge, "
+        "last_attempt_time AS time FROM users WHERE last_attempt_time IS NOT NULL "
+        "ORDER BY last_score DESC, last_attempt_time ASC"
+    ).fetchall()
+
+
+def load_period(since):
+    def loader(conn):
+        # Range scan on idx_attempts_time; SQLite returns the time/total of the best row
+        rows = conn.execute(
+            "SELECT a.user_id, u.username, MAX(a.score) AS score, a.total, a.time "
+            "FROM attempts a JOIN users u ON u.id = a.user_id "
+            "WHERE a.time >= ? GROUP BY a.user_id",
+            (since,),
+        ).fetchall()
+        return [dict(r, badge=badge_for(r["score"], r["total"])) for r in rows]
+    return loader
+
+
+class Leaderboard:
+    """In-process ranking of one board.
+
+    Loaded once from the database, updated incrementally by `record`, and
+    reloaded after CACHE_TTL so writes from other worker processes show up.
+    Pages cost O(log n + page size) and a user's rank costs O(log n).
+    """
+
+    def __init__(self, loader, keep_best=False, ttl=CACHE_TTL):
+        self.loader = loader
+        self.keep_best = keep_best
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._pending = None
+        self._entries = {}          # user_id -> (rank key, row dict)
+        self._ranking = RankedList()
+
+    @staticmethod
+    def _key(row):
+        return (-row["score"], row["time"] or "", row["user_id"])
+
+    def _apply(self, entries, ranking, row):
+        key = self._key(row)
+        old = entries.get(row["user_id"])
+        if old is not None:
+            if self.keep_best and old[0] <= key:
+                return
+            ranking.remove(old[0])
+        entries[row["user_id"]] = (key, row)
+        ranking.add(key)
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure(self, conn):
+        if self._fresh():
+            return
+        with self._load_lock:
+            if self._fresh():
+                return
+            with self._lock:
+                self._pending = []
+            entries = {}
+            for r in self.loader(conn):
+                row = dict(r)
+                entries[row["user_id"]] = (self._key(row), row)
+            ranking = RankedList(key for key, _ in entries.values())
+            with self._lock:
+                # Replay anything recorded while we were reading
+                for row in self._pending:
+                    self._apply(entries, ranking, row)
+                self._entries, self._ranking = entries, ranking
+                self._pending = None
+                self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Reload from the database on next use (another worker wrote to it)."""
+        self._loaded_at = None
+
+    def update(self, row):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(row)
+            self._apply(self._entries, self._ranking, row)
+
+    def page(self, conn, page=1, per_page=PAGE_SIZE):
+        """Rows for a 1-based page plus the total number of ranked users."""
+        self._ensure(conn)
+        start = (page - 1) * per_page
+        with self._lock:
+            keys = self._ranking.slice(start, start + per_page)
+            rows = [dict(self._entries[k[2]][1], rank=start + i + 1) for i, k in enumerate(keys)]
+            return rows, len(self._ranking)
+
+    def rank_of(self, conn, user_id):
+        """The user's row with its 1-based rank, or None if unranked."""
+        self._ensure(conn)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return dict(entry[1], rank=self._ranking.bisect_left(entry[0]) + 1)
+
+
+class Leaderboards:
+    """The all-time board plus rolling daily/weekly boards."""
+
+    def __init__(self):
+        self.overall = Leaderboard(load_overall)
+        self._lock = threading.Lock()
+        self._periods = {}  # period -> (start iso, Leaderboard)
+
+    def board(self, period="all"):
+        if period not in PERIODS or period == "all":
+            return self.overall
+        start = period_start(period)
+        with self._lock:
+            current = self._periods.get(period)
+            if current is None or current[0] != start:
+                current = (start, Leaderboard(load_period(start), keep_best=True))
+                self._periods[period] = current
+            return current[1]
+
+    def record(self, user_id, username, score, badge, when):
+        """Fold one quiz submission into every board it belongs to."""
+        row = dict(user_id=user_id, username=username, score=score, badge=badge, time=when)
+        self.overall.update(row)
+        with self._lock:
+            boards = [b for start, b in self._periods.values() if when >= start]
+        for board in boards:
+            board.update(row)
+
+
+leaderboards = Leaderboards()
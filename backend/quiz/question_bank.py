@@ -0,0 +1,74 @@
+# quiz/question_bank.py
+import json, os, threading
+
+# Single source of truth for quiz questions
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+QUESTION_BANK = os.path.join(BASE_DIR, "question_bank.json")
+
+
+class CompiledBank:
+    """Immutable, pre-indexed view of one version of the question bank."""
+
+    __slots__ = ("version", "questions", "ids", "by_id", "positions", "by_tag", "payloads")
+
+    def __init__(self, questions, version):
+        self.version = version
+        self.questions = tuple(questions)
+        self.by_id = {q["id"]: q for q in self.questions}
+        self.ids = tuple(self.by_id)
+        # Dense 0..n-1 slot per question, used as the bit position in seen-bitmaps
+        self.positions = {qid: pos for pos, qid in enumerate(self.ids)}
+
+        by_tag = {}
+        for q in self.questions:
+            for tag in q.get("tags") or ["untagged"]:
+                by_tag.setdefault(tag, []).append(q["id"])
+        self.by_tag = {tag: tuple(ids) for tag, ids in by_tag.items()}
+
+        # What the browser is allowed to see: everything except the answer
+        self.payloads = {
+            q["id"]: {k: v for k, v in q.items() if k != "answer"}
+            for q in self.questions
+        }
+
+    def __len__(self):
+        return len(self.questions)
+
+    def client_payloads(self, question_ids):
+        """Answer-stripped question dicts for the given ids, in order."""
+        return [self.payloads[qid] for qid in question_ids]
+
+
+class QuestionIndex:
+    """Process-wide question bank, parsed once and reloaded on mtime change."""
+
+    def __init__(self, path=QUESTION_BANK):
+        self.path = path
+        self._lock = threading.Lock()
+        self._bank = None
+
+    def current(self):
+        """Return the compiled bank, recompiling only if the file changed."""
+        bank = self._bank
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            # Keep serving the last good copy if the file is briefly missing
+            if bank is not None:
+                return bank
+            raise
+
+        if bank is not None and bank.version == mtime:
+            return bank
+
+        with self._lock:
+            bank = self._bank
+            if bank is None or bank.version != mtime:
+                with open(self.path, "r") as f:
+                    questions = json.load(f)
+                bank = CompiledBank(questions, mtime)
+                self._bank = bank
+            return bank
+
+
+question_index = QuestionIndex()
@@ -1,57 +1,29 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, g
-import sqlite3, os, json, random, datetime
-
-# Paths
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "database.db"))
-QUESTION_BANK = os.path.join(BASE_DIR, "question_bank.json")
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
+import json, datetime, time
+
+from db import get_db
+from write_behind import get_writer
+import live
+import progress
+import ratelimit
+from contest.contest_routes import record_solve
+from contest.scoreboard import contests
+from quiz.question_bank import question_index
+from quiz.sampler import sampler, QUIZ_SIZE
+from quiz.leaderboard import leaderboards, badge_for, PAGE_SIZE, PERIODS
+from quiz.stats import question_stats, pick_adaptive, update_ability, stats_ops, clean_time
 
 quiz_bp = Blueprint("quiz", __name__, template_folder="../templates/quiz", static_folder="../static/quiz")
 
-# --- DB Helpers ---
-def get_db():
-    if "quiz_db" not in g:
-        g.quiz_db = sqlite3.connect(DB_PATH)
-        g.quiz_db.row_factory = sqlite3.Row
-    return g.quiz_db
-
-@quiz_bp.teardown_request
-def close_db(exception):
-    db = g.pop("quiz_db", None)
-    if db is not None:
-        db.close()
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # Users table
-    # cur.execute('''CREATE TABLE IF NOT EXISTS users (
-    #     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    #     username TEXT UNIQUE,
-    #     user_name TEXT,
-    #     last_score INTEGER DEFAULT 0,
-    #     last_badge TEXT,
-    #     last_attempt_time TEXT,
-    #     last_questions TEXT
-    # )''')
-    # Attempts table
-    cur.execute('''CREATE TABLE IF NOT EXISTS attempts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        score INTEGER,
-        total INTEGER,
-        time TEXT,
-        question_ids TEXT
-    )''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-# --- Load Questions ---
-def load_questions():
-    with open(QUESTION_BANK, "r") as f:
-        return json.load(f)
+QUIZ_SECONDS = 90       # timer outside contests
+SUBMIT_GRACE = 5        # seconds allowed past the timer for the auto-submit to arrive
+MAX_TAGS = 20           # topics a quiz can be narrowed to
+
+def current_ability(user_id):
+    """Learner level: cached in the session, else one progress-row lookup."""
+    if "quiz_ability" not in session:
+        session["quiz_ability"] = progress.get_progress(user_id)["quiz_ability"]
+    return session["quiz_ability"]
 
 # --- Routes ---
 @quiz_bp.route("/quiz")
@@ -61,87 +33,122 @@ def quiz():
     return render_template("quiz/quiz.html")
 
 @quiz_bp.route("/quiz/start", methods=["POST"])
+@ratelimit.limit("quiz", rate=20, per=60, burst=10)
 def start_quiz():
     if "user_id" not in session:
         return jsonify({"error": "not_logged_in"}), 403
 
     user_id = session["user_id"]
-    questions = load_questions()
-
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT last_questions FROM users WHERE id=?", (user_id,))
-    row = cur.fetchone()
-    last_qs = []
-    if row and row["last_questions"]:
-        try:
-            last_qs = json.loads(row["last_questions"])
-        except:
-            last_qs = []
-
-    # Pick 8 random questions
-    pool = [q for q in questions if q["id"] not in last_qs]
-    if len(pool) < 8:
-        pool = questions[:]
-    chosen = random.sample(pool, 8)
-
-    # Save question IDs in session
-    session["current_question_ids"] = [q["id"] for q in chosen]
+    bank = question_index.current()
+
+    # Optional {"tags": [...]} body narrows the quiz to those topics;
+    # {"mode": "adaptive"} picks questions near the learner's level instead
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "bad_request"}), 400
+    tags = body.get("tags")
+    if tags is not None and not (isinstance(tags, list) and len(tags) <= MAX_TAGS
+                                 and all(isinstance(t, str) for t in tags)):
+        return jsonify({"error": "bad_tags"}), 400
+    mode = body.get("mode") or request.args.get("mode")
+
+    seen = sampler.seen_for(get_db(), user_id, bank)
+    if mode == "adaptive":
+        index = question_stats.index(get_db(readonly=True), bank)
+        chosen = pick_adaptive(index, bank, current_ability(user_id), seen, QUIZ_SIZE)
+    else:
+        # Tag-balanced pick that avoids the user's recent quizzes
+        chosen = sampler.draw(bank, seen, QUIZ_SIZE, tags=tags)
+
+    # Save question IDs in session; the deadline is checked again on submit
+    contest = contests.active(get_db(readonly=True))
+    timer = contest.quiz_seconds if contest else QUIZ_SECONDS
+    session["current_question_ids"] = chosen
+    session["quiz_deadline"] = time.time() + timer
+    session["quiz_seconds"] = timer
 
     # Don’t send answers to frontend
-    for q in chosen:
-        q.pop("answer", None)
-
-    return jsonify({"questions": chosen, "timer": 90})
+    return jsonify({"questions": bank.client_payloads(chosen), "timer": timer})
 
 @quiz_bp.route("/quiz/submit", methods=["POST"])
+@ratelimit.limit("quiz", rate=20, per=60, burst=10)
 def submit():
     if "user_id" not in session:
         return redirect(url_for("index"))
 
-    data = request.json
-    answers = data.get("answers", {})
-    question_ids = session.get("current_question_ids", [])
-    all_questions = load_questions()
-    qmap = {q["id"]: q for q in all_questions}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "bad_request"}), 400
+    # Anything malformed counts as unanswered / untimed rather than failing the submit
+    answers = data.get("answers")
+    answers = answers if isinstance(answers, dict) else {}
+    times = data.get("times")
+    times = times if isinstance(times, dict) else {}
+
+    deadline = session.pop("quiz_deadline", None)
+    timer = session.pop("quiz_seconds", QUIZ_SECONDS)
+    if deadline is None or "current_question_ids" not in session:
+        # Never started, or already submitted: nothing to score
+        session.pop("current_question_ids", None)
+        return jsonify({"error": "no_active_quiz"}), 409
+    if time.time() > deadline + SUBMIT_GRACE:
+        session.pop("current_question_ids", None)
+        return jsonify({"error": "time_up"}), 409
+    max_time_ms = (timer + SUBMIT_GRACE) * 1000
+    bank = question_index.current()
+    qmap = bank.by_id
+    # The bank reloads while the server runs: questions removed since /quiz/start aren't scored
+    question_ids = [int(qid) for qid in session.get("current_question_ids", []) if int(qid) in qmap]
+    if not question_ids:
+        session.pop("current_question_ids", None)
+        return jsonify({"error": "quiz_changed"}), 409
 
     score = 0
     total = len(question_ids)
     correct_questions = []
     wrong_questions = []
 
+    results = []    # (qid, correct, time_ms) per question
     for qid in question_ids:
-        qid = int(qid)
         correct = qmap[qid]["answer"]
         selected = answers.get(str(qid), None)
-        if selected is not None and int(selected) == int(correct):
+        try:
+            ok = selected is not None and int(selected) == int(correct)
+        except (TypeError, ValueError):
+            ok = False
+        if ok:
             score += 1
             correct_questions.append(qmap[qid]["question"])
         else:
             wrong_questions.append(qmap[qid]["question"])
+        results.append((qid, ok, clean_time(times.get(str(qid)), max_time_ms)))
 
-    # Badge logic
-    badge = "Keep Practicing"
-    if score == total:
-        badge = "Cyber Hero"
-    elif score >= total * 0.75:
-        badge = "Cyber Defender"
-    elif score >= total * 0.5:
-        badge = "Cyber Learner"
-
-    # Save to DB
-    conn = get_db()
-    cur = conn.cursor()
+    badge = badge_for(score, total)
+
+    # Move the learner's level using the questions' current difficulty
+    conn = get_db(readonly=True)
+    difficulties = {qid: question_stats.difficulty_of(conn, qid) for qid, _, _ in results}
+    ability = update_ability(current_ability(session["user_id"]), results, difficulties)
+    session["quiz_ability"] = ability
+
+    # Save to DB: queued for the next group commit, the response doesn't wait on disk
     now = datetime.datetime.utcnow().isoformat()
-    cur.execute(
-        "INSERT INTO attempts (user_id, score, total, time, question_ids) VALUES (?,?,?,?,?)",
-        (session["user_id"], score, total, now, json.dumps(question_ids)),
-    )
-    cur.execute(
-        "UPDATE users SET last_score=?, last_badge=?, last_attempt_time=?, last_questions=? WHERE id=?",
-        (score, badge, now, json.dumps(question_ids), session["user_id"]),
+    get_writer().write(
+        ("INSERT INTO attempts (user_id, score, total, time, question_ids) VALUES (?,?,?,?,?)",
+         (session["user_id"], score, total, now, json.dumps(question_ids))),
+        ("UPDATE users SET last_score=?, last_badge=?, last_attempt_time=?, last_questions=? WHERE id=?",
+         (score, badge, now, json.dumps(question_ids), session["user_id"])),
+        progress.quiz_op(session["user_id"], score, badge, now),
+        *stats_ops(session["user_id"], now, results, ability),
     )
-    conn.commit()
+    question_stats.record(results)
+    sampler.record(session["user_id"], bank, question_ids)
+    leaderboards.record(session["user_id"], session.get("user_name"), score, badge, now)
+    hub = live.get_hub()
+    for period in PERIODS:
+        hub.publish("leaderboard:" + period, session["user_id"])
+    if total:
+        record_solve("quiz", score / total)
 
     # Clean up
     session.pop("current_question_ids", None)
@@ -155,13 +162,51 @@ def submit():
     }
     return jsonify(result)
 
+def leaderboard_page():
+    """Resolve ?period=&page= into one page of a board plus the viewer's rank."""
+    period = request.args.get("period", "all")
+    if period not in PERIODS:
+        period = "all"
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    conn = get_db(readonly=True)
+    board = leaderboards.board(period)
+    rows, total = board.page(conn, page, PAGE_SIZE)
+    me = board.rank_of(conn, session["user_id"]) if "user_id" in session else None
+    pages = max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    return dict(leaderboard=rows, me=me, period=period, page=page, pages=pages, total=total)
+
 @quiz_bp.route("/quiz/leaderboard")
 def leaderboard():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT username, last_score, last_badge, last_attempt_time FROM users "
-        "ORDER BY last_score DESC, last_attempt_time ASC LIMIT 20"
-    )
-    rows = [dict(x) for x in cur.fetchall()]
-    return render_template("quiz/leaderboard.html", leaderboard=rows)
+    return render_template("quiz/leaderboard.html", **leaderboard_page())
+
+@quiz_bp.route("/quiz/leaderboard/data")
+def leaderboard_data():
+    return jsonify(leaderboard_page())
+
+@live.renderer("leaderboard")
+def leaderboard_event(topic, changed):
+    """First page of a board, plus the new ranks of users who just submitted."""
+    period = topic.split(":", 1)[1]
+    conn = get_db(readonly=True)
+    board = leaderboards.board(period)
+    rows, total = board.page(conn, 1, PAGE_SIZE)
+    event = dict(period=period, leaderboard=rows, total=total)
+    if changed:
+        event["changed"] = [row for row in (board.rank_of(conn, uid) for uid in changed) if row is not None]
+    return event
+
+@live.refresher("leaderboard")
+def leaderboard_refresh(topic):
+    leaderboards.board(topic.split(":", 1)[1]).invalidate()
+
+@quiz_bp.route("/quiz/leaderboard/stream")
+def leaderboard_stream():
+    """Server-Sent Events feed of a board's first page (pushed, coalesced per tick)."""
+    period = request.args.get("period", "all")
+    if period not in PERIODS:
+        period = "all"
+    resp = live.get_hub().open_stream("leaderboard:" + period, request.headers.get("Last-Event-ID"))
+    if resp is None:
+        return jsonify({"error": "stream_unavailable"}), 503, {"Retry-After": "10"}
+    return resp
@@ -0,0 +1,159 @@
+# quiz/sampler.py
+import json, random, threading
+from collections import OrderedDict, deque
+
+QUIZ_SIZE = 8
+HISTORY_ATTEMPTS = 3      # how many past quizzes count as "recently seen"
+TRIES_PER_SLOT = 4        # random probes per slot before scanning the tag's pool
+SCAN_LIMIT = 256          # pool entries scanned for a fresh question after the probes miss
+MAX_CACHED_USERS = 5000
+
+
+class SeenBitmap:
+    """Compact set of recently seen questions: one bit per bank position."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bank, question_ids=()):
+        self.bits = bytearray((len(bank) >> 3) + 1)
+        for qid in question_ids:
+            pos = bank.positions.get(qid)
+            if pos is not None:
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, pos):
+        return bool(self.bits[pos >> 3] & (1 << (pos & 7)))
+
+
+class QuestionSampler:
+    """Draws tag-balanced quizzes that avoid each user's recent questions.
+
+    Work per draw is proportional to the quiz size, not the bank size: tag
+    pools come precompiled from the bank and "seen" checks are bit tests.
+    """
+
+    def __init__(self, history=HISTORY_ATTEMPTS, max_users=MAX_CACHED_USERS):
+        self.history = history
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # user_id -> (bank version, deque of recent question-id lists, SeenBitmap)
+        self._users = OrderedDict()
+
+    # --- Per-user history ---
+    def _load_history(self, conn, user_id):
+        rows = conn.execute(
+            "SELECT question_ids FROM attempts WHERE user_id=? ORDER BY time DESC LIMIT ?",
+            (user_id, self.history),
+        ).fetchall()
+        recent = deque(maxlen=self.history)
+        for row in reversed(rows):
+            try:
+                recent.append([int(qid) for qid in json.loads(row["question_ids"] or "[]")])
+            except (TypeError, ValueError):
+                continue
+        return recent
+
+    def _store(self, user_id, bank, recent):
+        seen = SeenBitmap(bank, (qid for ids in recent for qid in ids))
+        with self._lock:
+            self._users[user_id] = (bank.version, recent, seen)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return seen
+
+    def seen_for(self, conn, user_id, bank):
+        """Return the user's seen-bitmap, building it from `attempts` on a miss."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+        if entry is not None:
+            version, recent, seen = entry
+            if version == bank.version:
+                return seen
+            # Bank was reloaded: positions moved, rebuild from the cached history
+            return self._store(user_id, bank, recent)
+        return self._store(user_id, bank, self._load_history(conn, user_id))
+
+    def record(self, user_id, bank, question_ids):
+        """Fold a finished quiz into the user's cached history."""
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None:
+            # Nothing cached yet; the next draw will read it back from `attempts`
+            return
+        recent = deque(entry[1], maxlen=self.history)
+        recent.append([int(qid) for qid in question_ids])
+        self._store(user_id, bank, recent)
+
+    # --- Drawing ---
+    @staticmethod
+    def _pick_fresh(bank, pool, seen, taken, rng):
+        """A random unseen, untaken id from `pool`, or None if it has none.
+
+        A few random probes find one cheaply while most of the pool is
+        fresh. After they miss, up to SCAN_LIMIT entries from a random
+        offset are scanned (the whole pool for every tag we have), so a
+        pool is only given up on when it really is used up.
+        """
+        def fresh(qid):
+            return qid not in taken and (seen is None or bank.positions[qid] not in seen)
+
+        for _ in range(TRIES_PER_SLOT):
+            qid = pool[rng.randrange(len(pool))]
+            if fresh(qid):
+                return qid
+        start = rng.randrange(len(pool))
+        window = min(len(pool), SCAN_LIMIT)
+        candidates = [q for q in (pool[(start + i) % len(pool)] for i in range(window)) if fresh(q)]
+        return rng.choice(candidates) if candidates else None
+
+    def draw(self, bank, seen=None, k=QUIZ_SIZE, tags=None, rng=random):
+        """Pick up to `k` distinct question ids spread evenly across tags."""
+        k = min(k, len(bank))
+        selected = [bank.by_tag[t] for t in (tags or ()) if t in bank.by_tag]
+        if not selected:
+            selected = list(bank.by_tag.values())
+        pools = selected[:]
+        rng.shuffle(pools)
+        chosen, taken = [], set()
+
+        # Round-robin over tag pools, skipping anything seen recently
+        while len(chosen) < k and pools:
+            for pool in list(pools):
+                if len(chosen) >= k:
+                    break
+                qid = self._pick_fresh(bank, pool, seen, taken, rng)
+                if qid is None:
+                    pools.remove(pool)
+                else:
+                    chosen.append(qid)
+                    taken.add(qid)
+
+        # Not enough fresh questions: top up from the same pools, ignoring history
+        probes = k * TRIES_PER_SLOT
+        while len(chosen) < k and probes:
+            probes -= 1
+            pool = selected[rng.randrange(len(selected))]
+            qid = pool[rng.randrange(len(pool))]
+            if qid not in taken:
+                chosen.append(qid)
+                taken.add(qid)
+
+        # Tiny pools only: deterministic fill so we return as many as exist
+        for pool in selected:
+            if len(chosen) >= k:
+                break
+            for qid in pool:
+                if qid not in taken:
+                    chosen.append(qid)
+                    taken.add(qid)
+                    if len(chosen) == k:
+                        break
+
+        rng.shuffle(chosen)
+        return chosen
+
+
+sampler = QuestionSampler()
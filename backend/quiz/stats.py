@@ -0,0 +1,176 @@
+# quiz/stats.py
+import bisect, math, random, threading, time
+
+# Difficulty is the log-odds of a wrong answer, smoothed with one imaginary
+# right and one imaginary wrong answer so unseen questions start at 0.
+# A learner's ability lives on the same scale: at ability == difficulty
+# they are expected to answer correctly half the time.
+K_FACTOR = 0.4              # ability step per answer
+ABILITY_RANGE = 4.0
+TARGET_OFFSET = -0.4        # aim slightly below ability (~60% expected success)
+WINDOW = 3                  # candidates considered per slot around the target
+REBUILD_EVERY = 5.0         # seconds between re-sorting the difficulty index
+MAX_TIME_MS = 10 * 60 * 1000
+
+
+def difficulty(attempts, correct):
+    p = (correct + 1.0) / (attempts + 2.0)
+    return math.log((1.0 - p) / p)
+
+
+def expected(ability, diff):
+    return 1.0 / (1.0 + math.exp(diff - ability))
+
+
+class DifficultyIndex:
+    """Bank question ids sorted by difficulty, for one bank version."""
+
+    __slots__ = ("version", "keys", "ids")
+
+    def __init__(self, version, pairs):
+        pairs = sorted(pairs)
+        self.version = version
+        self.keys = [d for d, _ in pairs]
+        self.ids = [qid for _, qid in pairs]
+
+
+class QuestionStats:
+    """In-memory mirror of question_stats, kept current on every submit.
+
+    The table is read once per process; afterwards each submission updates
+    both the table (through the write-behind queue) and these counters, so
+    choosing adaptive questions never queries the database. Other workers'
+    answers show up here after a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = None         # qid -> [attempts, correct]
+        self._index = None
+        self._built_at = 0.0
+        self._dirty = False
+
+    def _load(self, conn):
+        counts = {}
+        for row in conn.execute("SELECT question_id, attempts, correct FROM question_stats"):
+            counts[row["question_id"]] = [row["attempts"], row["correct"]]
+        return counts
+
+    def _ensure(self, conn):
+        if self._counts is None:
+            counts = self._load(conn)
+            with self._lock:
+                if self._counts is None:
+                    self._counts = counts
+
+    def difficulty_of(self, conn, qid):
+        self._ensure(conn)
+        attempts, correct = self._counts.get(qid, (0, 0))
+        return difficulty(attempts, correct)
+
+    def index(self, conn, bank):
+        """Difficulty-sorted view of `bank`, re-sorted at most every few seconds."""
+        self._ensure(conn)
+        idx = self._index
+        now = time.monotonic()
+        if idx is not None and idx.version == bank.version and (
+                not self._dirty or now - self._built_at < REBUILD_EVERY):
+            return idx
+        with self._lock:
+            counts = self._counts
+            pairs = [(difficulty(*counts.get(qid, (0, 0))), qid) for qid in bank.ids]
+            self._index = idx = DifficultyIndex(bank.version, pairs)
+            self._built_at = now
+            self._dirty = False
+        return idx
+
+    def record(self, results):
+        """Fold (qid, correct, time_ms) outcomes into the in-memory counts."""
+        if self._counts is None:
+            return
+        with self._lock:
+            for qid, correct, _ in results:
+                entry = self._counts.setdefault(qid, [0, 0])
+                entry[0] += 1
+                entry[1] += 1 if correct else 0
+            self._dirty = True
+
+
+def update_ability(ability, results, difficulties):
+    """Elo-style step towards the observed outcomes."""
+    for qid, correct, _ in results:
+        ability += K_FACTOR * ((1.0 if correct else 0.0) - expected(ability, difficulties[qid]))
+    return max(-ABILITY_RANGE, min(ABILITY_RANGE, ability))
+
+
+def pick_adaptive(index, bank, ability, seen=None, k=8, rng=random):
+    """k unseen question ids whose difficulty is closest to the target level.
+
+    Walks outwards from the target in the sorted index, so the cost is
+    O(log n + k * WINDOW) whatever the size of the bank.
+    """
+    target = ability + TARGET_OFFSET
+    n = len(index.ids)
+    want = min(n, k * WINDOW)
+    lo = bisect.bisect_left(index.keys, target) - 1
+    hi = lo + 1
+    fresh, stale = [], []
+
+    # Nearest first; recently seen questions are kept only as a fallback
+    while len(fresh) < want and (lo >= 0 or hi < n):
+        if lo < 0 or (hi < n and index.keys[hi] - target <= target - index.keys[lo]):
+            pos, hi = hi, hi + 1
+        else:
+            pos, lo = lo, lo - 1
+        qid = index.ids[pos]
+        if seen is not None and bank.positions[qid] in seen:
+            stale.append(qid)
+        else:
+            fresh.append(qid)
+
+    candidates = fresh if len(fresh) >= k else fresh + stale[:k - len(fresh)]
+    chosen = rng.sample(candidates, min(k, len(candidates)))
+    rng.shuffle(chosen)
+    return chosen
+
+
+def stats_ops(user_id, when, results, ability):
+    """Write-behind statements for one submission's per-answer outcomes."""
+    ability_op = ("UPDATE user_progress SET quiz_ability = ? WHERE user_id = ?", (ability, user_id))
+    if not results:
+        return [ability_op]
+    answer_rows = ", ".join("(?, ?, ?, ?, ?)" for _ in results)
+    answer_params = []
+    for qid, correct, ms in results:
+        answer_params.extend((user_id, when, qid, 1 if correct else 0, ms))
+    stat_rows = ", ".join("(?, 1, ?, ?, ?)" for _ in results)
+    stat_params = []
+    for qid, correct, ms in results:
+        stat_params.extend((qid, 1 if correct else 0, ms or 0, 1 if ms is not None else 0))
+    return [
+        ("INSERT OR IGNORE INTO attempt_answers (user_id, attempt_time, question_id, correct, time_ms) "
+         "VALUES " + answer_rows, tuple(answer_params)),
+        # O(1) per answer: running totals, never a re-scan of attempt_answers
+        ("INSERT INTO question_stats (question_id, attempts, correct, total_time_ms, timed) VALUES " + stat_rows +
+         " ON CONFLICT(question_id) DO UPDATE SET attempts = attempts + excluded.attempts, "
+         "correct = correct + excluded.correct, total_time_ms = total_time_ms + excluded.total_time_ms, "
+         "timed = timed + excluded.timed", tuple(stat_params)),
+        ability_op,
+    ]
+
+
+def clean_time(value, limit_ms=MAX_TIME_MS):
+    """Client-reported milliseconds on a question, clamped to [0, limit_ms],
+    or None if it isn't a finite number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        ms = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(ms):
+        return None
+    return int(min(max(ms, 0), limit_ms, MAX_TIME_MS))
+
+
+question_stats = QuestionStats()
@@ -0,0 +1,123 @@
+# ranking.py
+from bisect import bisect_left, insort
+
+BUCKET_SIZE = 256
+
+
+class RankedList:
+    """Sorted list of comparable keys with O(log n) insert, remove and rank.
+
+    Keys live in sorted buckets of roughly BUCKET_SIZE items. A Fenwick tree
+    over the bucket lengths turns "how many keys sort before this one" and
+    "which key sits at position i" into logarithmic lookups.
+    """
+
+    def __init__(self, keys=()):
+        self._build(sorted(keys))
+
+    # --- Internal structure ---
+    def _build(self, keys):
+        self._buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self._maxes = [b[-1] for b in self._buckets]
+        self._len = len(keys)
+        self._rebuild_tree()
+
+    def _rebuild_tree(self):
+        n = len(self._buckets)
+        tree = [0] * (n + 1)
+        for i, bucket in enumerate(self._buckets, 1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, bucket_idx, delta):
+        i, tree = bucket_idx + 1, self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, bucket_idx):
+        """Number of keys in the buckets before `bucket_idx`."""
+        total, i = 0, bucket_idx
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        """Map a flat position to (bucket index, offset inside the bucket)."""
+        pos, tree = 0, self._tree
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                pos = nxt
+                index -= tree[nxt]
+            step >>= 1
+        return pos, index
+
+    # --- Public API ---
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def add(self, key):
+        if not self._buckets:
+            self._build([key])
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            i -= 1
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self._buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._maxes[i:i + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            raise KeyError(key)
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            raise KeyError(key)
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def bisect_left(self, key):
+        """Number of keys that sort strictly before `key`."""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._prefix(i) + bisect_left(self._buckets[i], key)
+
+    def slice(self, start, stop):
+        """Keys at positions [start, stop), like list slicing."""
+        start, stop = max(start, 0), min(stop, self._len)
+        out = []
+        if start >= stop:
+            return out
+        i, offset = self._locate(start)
+        while len(out) < stop - start and i < len(self._buckets):
+            need = stop - start - len(out)
+            out.extend(self._buckets[i][offset:offset + need])
+            i, offset = i + 1, 0
+        return out
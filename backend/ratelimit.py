@@ -0,0 +1,141 @@
+# ratelimit.py
+import collections, functools, threading, time
+
+from flask import current_app, jsonify, render_template, request, session
+
+from db import get_db
+import startup
+
+DEFAULT_SHARDS = 16
+DEFAULT_MAX_KEYS = 100000   # buckets kept in memory across all shards
+PURGE_EVERY = 1000          # sqlite: drop idle buckets every N checks
+
+
+# -------------------- Keys --------------------
+def by_ip():
+    # remote_addr is the proxy's address unless the app is wrapped in ProxyFix
+    return "ip:%s" % request.remote_addr
+
+
+def by_ip_and_email():
+    # Per account and client, for forms that run before anyone is logged in. Keying on the
+    # email alone would let anyone lock a victim out by failing logins as them.
+    return "ip:%s:email:%s" % (request.remote_addr, (request.form.get("email") or "").strip().lower())
+
+
+def by_user_or_ip():
+    user_id = session.get("user_id")
+    return "user:%s" % user_id if user_id is not None else by_ip()
+
+
+# -------------------- Stores --------------------
+class MemoryStore:
+    """Token buckets in sharded LRUs: one lock per shard, O(1) per check.
+
+    A bucket is (tokens, updated_at). Each check moves its bucket to the
+    recent end of its shard; when a shard outgrows its share of max_keys
+    the least recently used bucket goes. That is the one most likely to
+    have refilled, and a full bucket is the same as no bucket.
+    """
+
+    def __init__(self, shards=DEFAULT_SHARDS, max_keys=DEFAULT_MAX_KEYS):
+        self._shards = [(collections.OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self._per_shard = max(1, max_keys // shards)
+
+    def take(self, key, capacity, rate, now):
+        """Spend one token. Returns 0 if allowed, else seconds until one is available."""
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            tokens, updated = buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if key in buckets:
+                buckets.move_to_end(key)
+            elif len(buckets) >= self._per_shard:
+                buckets.popitem(last=False)
+            if tokens < 1:
+                buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            buckets[key] = (tokens - 1, now)
+            return 0
+
+
+class SqliteStore:
+    """Buckets in database.db, so every worker process shares one limit.
+
+    One upsert per check: the refill, the spend and the "enough tokens?"
+    test all happen inside SQLite, so concurrent workers can't both spend
+    the last token.
+    """
+
+    def __init__(self):
+        self._checks = 0
+
+    def take(self, key, capacity, rate, now):
+        conn = get_db()
+        row = conn.execute(
+            "INSERT INTO rate_limits (key, tokens, updated_at) VALUES (:key, :capacity - 1, :now) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "tokens = MIN(:capacity, tokens + (:now - updated_at) * :rate) - 1, updated_at = :now "
+            "WHERE MIN(:capacity, tokens + (:now - updated_at) * :rate) >= 1 "
+            "RETURNING tokens",
+            {"key": key, "capacity": capacity, "rate": rate, "now": now},
+        ).fetchone()
+        retry_after = 0
+        if row is None:
+            tokens, updated = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            retry_after = (1 - min(capacity, tokens + (now - updated) * rate)) / rate
+        self._checks += 1
+        if self._checks % PURGE_EVERY == 0:
+            # Anything idle for a day has refilled under every policy we use
+            conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - 86400,))
+        conn.commit()
+        return retry_after
+
+
+# -------------------- Policies --------------------
+def limited_response(retry_after):
+    retry_after = max(1, int(retry_after + 0.999))
+    headers = {"Retry-After": str(retry_after)}
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        return jsonify({"error": "rate_limited", "retry_after": retry_after}), 429, headers
+    return render_template("rate_limited.html", retry_after=retry_after), 429, headers
+
+
+def limit(name, rate, per=60, burst=None, key=by_user_or_ip, methods=("POST",)):
+    """Allow `rate` requests per `per` seconds (bursts up to `burst`) per key.
+
+    `name` groups routes into one budget; RATELIMITS = {name: (rate, per,
+    burst)} in the config overrides the numbers. Only `methods` are
+    counted, so the page a form lives on can still be viewed.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            store = current_app.extensions.get("ratelimit")
+            if store is None or request.method not in methods:
+                return view(*args, **kwargs)
+            r, p, b = current_app.config.get("RATELIMITS", {}).get(name, (rate, per, burst))
+            capacity = b or r
+            retry_after = store.take("%s:%s" % (name, key()), capacity, r / p, time.time())
+            if retry_after:
+                return limited_response(retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """RATELIMIT_BACKEND = "memory" (default, per process), "sqlite" (one
+    limit across workers, at a write transaction per check) or "off"."""
+    backend = app.config.get("RATELIMIT_BACKEND", "memory")
+    if backend == "off":
+        return None
+    if backend == "memory":
+        startup.warn_if_multiprocess(app, 'RATELIMIT_BACKEND="memory"')
+    store = SqliteStore() if backend == "sqlite" else MemoryStore(
+        shards=int(app.config.get("RATELIMIT_SHARDS", DEFAULT_SHARDS)),
+        max_keys=int(app.config.get("RATELIMIT_MAX_KEYS", DEFAULT_MAX_KEYS)),
+    )
+    app.extensions["ratelimit"] = store
+    return store
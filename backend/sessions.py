@@ -0,0 +1,171 @@
+# sessions.py
+import secrets, threading, time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from db import get_db
+import startup
+
+DEFAULT_TTL = 12 * 3600          # idle lifetime of a non-permanent session
+DEFAULT_MAX_ENTRIES = 10000      # memory backend LRU bound
+PURGE_EVERY = 500                # sqlite backend: purge expired rows every N writes
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session data held on the server; the cookie only carries `sid`."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+    def clear(self):
+        # Clearing happens on login/logout: issue a fresh id to prevent fixation
+        super().clear()
+        self.rotate = True
+
+
+# -------------------- Backends --------------------
+class MemoryStore:
+    """Process-local LRU with per-entry expiry. Single-worker deployments."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()      # sid -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return entry
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            self._data[sid] = (time.time() + ttl, payload)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class SqliteStore:
+    """Sessions in database.db, shared by every worker process."""
+
+    def __init__(self):
+        self._writes = 0
+
+    def get(self, sid):
+        row = get_db().execute(
+            "SELECT expires_at, data FROM sessions WHERE sid=? AND expires_at>?", (sid, time.time())
+        ).fetchone()
+        return (row["expires_at"], row["data"]) if row else None
+
+    def set(self, sid, payload, ttl):
+        conn = get_db()
+        conn.execute(
+            "INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET data=excluded.data, expires_at=excluded.expires_at",
+            (sid, payload, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at<=?", (time.time(),))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = get_db()
+        conn.execute("DELETE FROM sessions WHERE sid=?", (sid,))
+        conn.commit()
+
+
+# -------------------- Interface --------------------
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl=DEFAULT_TTL):
+        self.store = store
+        self.ttl = ttl
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return self.ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.get(sid)
+            if entry is not None:
+                expires_at, payload = entry
+                session = ServerSideSession(self.serializer.loads(payload), sid=sid)
+                # Sliding expiry, but only rewrite once half the lifetime is used up
+                session.expires_at = expires_at
+                return session
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.rotate and not session.new:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+            if session.modified or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        ttl = self._ttl(app, session)
+        stale = getattr(session, "expires_at", 0) - time.time() < ttl / 2
+        if session.modified or session.new or stale:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+
+        if session.new or (session.permanent and stale):
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def init_app(app):
+    """SESSION_BACKEND = "sqlite" (default, shared by every worker) or
+    "memory" for a single-process server."""
+    backend = app.config.get("SESSION_BACKEND", "sqlite")
+    store = SqliteStore() if backend == "sqlite" else MemoryStore(
+        int(app.config.get("SESSION_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    )
+    if backend == "memory":
+        startup.warn_if_multiprocess(app, 'SESSION_BACKEND="memory"')
+    app.session_interface = ServerSideSessionInterface(store, int(app.config.get("SESSION_TTL", DEFAULT_TTL)))
+    return app.session_interface
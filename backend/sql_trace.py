@@ -0,0 +1,142 @@
+# sql_trace.py
+import logging, sqlite3, threading
+
+from flask import g, has_request_context, request
+
+import db
+
+log = logging.getLogger("cybercase.sql")
+
+DEFAULT_SLOW_MS = 100
+DEFAULT_REPEAT_LIMIT = 5    # same statement this often in one request smells like N+1
+TRANSACTION_WORDS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+
+def redact(params):
+    """Describe bound parameters without revealing their values."""
+    if params is None:
+        return None
+
+    def mask(value):
+        if value is None:
+            return None
+        if isinstance(value, (str, bytes)):
+            return "<%s len=%d>" % (type(value).__name__, len(value))
+        return "<%s>" % type(value).__name__
+
+    if isinstance(params, dict):
+        return {k: mask(v) for k, v in params.items()}
+    return tuple(mask(v) for v in params)
+
+
+def _request_stats():
+    return g.setdefault("_sql_stats", {"statements": 0, "transactions": 0, "time": 0.0, "seen": {}})
+
+
+def full_scans(plan):
+    """Tables the plan reads without an index ("SCAN users", not "... USING INDEX")."""
+    return [detail for detail in plan
+            if detail.startswith("SCAN ") and "USING" not in detail and "CONSTANT ROW" not in detail]
+
+
+class SqlTracer:
+    """Per-request query accounting, slow-query log and plan capture.
+
+    Statement counts come from sqlite3 trace callbacks, which also see the
+    BEGIN/COMMIT the sqlite3 module issues on its own. Timings come from
+    db's instrumented cursors. Each distinct statement is EXPLAINed once per
+    process; a plan with a full-table scan is logged the first time it is
+    seen, and slow statements are logged with their plan and redacted
+    parameters.
+    """
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, repeat_limit=DEFAULT_REPEAT_LIMIT):
+        self.slow = slow_ms / 1000.0
+        self.repeat_limit = repeat_limit
+        self._plans = {}            # sql -> list of plan detail strings (or None)
+        self._lock = threading.Lock()
+
+    # --- Hooks ---
+    def on_connect(self, conn, name):
+        conn.set_trace_callback(self.on_statement)
+
+    def on_statement(self, statement):
+        # The callback gets SQL with values expanded in; count it, never keep it
+        if not has_request_context():
+            return
+        head = statement.lstrip().upper()
+        if head.startswith("EXPLAIN"):
+            return      # our own plan capture
+        stats = _request_stats()
+        if head.startswith(TRANSACTION_WORDS):
+            stats["transactions"] += 1
+        else:
+            stats["statements"] += 1
+
+    def on_query(self, conn, sql, params, seconds, phase):
+        if has_request_context():
+            stats = _request_stats()
+            stats["time"] += seconds
+            if phase == "execute":
+                stats["seen"][sql] = stats["seen"].get(sql, 0) + 1
+        if sql is None or phase != "execute":
+            return
+        plan = self.plan_for(conn, sql, params)
+        if seconds >= self.slow:
+            log.warning("slow query %.1fms: %s params=%s plan=%s",
+                        seconds * 1000, " ".join(sql.split()), redact(params), plan)
+
+    # --- Plans ---
+    def plan_for(self, conn, sql, params):
+        if sql in self._plans:
+            return self._plans[sql]
+        plan = None
+        if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH", "REPLACE")):
+            try:
+                # A plain cursor, so EXPLAIN itself isn't traced
+                rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+                plan = [row[3] for row in rows]
+            except sqlite3.Error:
+                plan = None     # e.g. executemany without a single parameter set
+        with self._lock:
+            first = sql not in self._plans
+            self._plans[sql] = plan
+        if first and plan and full_scans(plan):
+            log.warning("full table scan: %s -> %s", " ".join(sql.split()), "; ".join(full_scans(plan)))
+        return plan
+
+    def report(self):
+        """Every statement seen so far with its plan, scans first."""
+        with self._lock:
+            items = list(self._plans.items())
+        return sorted(({"sql": " ".join(sql.split()), "plan": plan, "full_scans": full_scans(plan or [])}
+                       for sql, plan in items), key=lambda r: (not r["full_scans"], r["sql"]))
+
+    # --- Per request ---
+    def finish(self, response):
+        stats = g.pop("_sql_stats", None)
+        if not stats:
+            return response
+        response.headers["X-SQL-Queries"] = str(stats["statements"])
+        response.headers["X-SQL-Time-Ms"] = "%.2f" % (stats["time"] * 1000)
+        repeated = {sql: n for sql, n in stats["seen"].items() if n >= self.repeat_limit}
+        for sql, n in repeated.items():
+            log.warning("%s %s ran %dx in one request (N+1?): %s",
+                        request.method, request.path, n, " ".join(sql.split()))
+        log.debug("%s %s: %d statements, %d transaction statements, %.2fms in SQLite",
+                  request.method, request.path, stats["statements"], stats["transactions"], stats["time"] * 1000)
+        return response
+
+
+def init_app(app):
+    """SQL_TRACE=True turns tracing on; SLOW_QUERY_MS sets the slow-log threshold."""
+    if not app.config.get("SQL_TRACE", False):
+        return None
+    tracer = app.extensions["sql_trace"] = SqlTracer(
+        slow_ms=float(app.config.get("SLOW_QUERY_MS", DEFAULT_SLOW_MS)),
+        repeat_limit=int(app.config.get("SQL_REPEAT_LIMIT", DEFAULT_REPEAT_LIMIT)),
+    )
+    db.on_connect(tracer.on_connect, key="sql_trace")
+    db.observe_queries(tracer.on_query, key="sql_trace")
+    app.after_request(tracer.finish)
+    return tracer
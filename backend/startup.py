@@ -0,0 +1,85 @@
+# startup.py
+import contextlib, logging, time
+
+try:
+    import fcntl
+except ImportError:         # Windows dev machines: a single process, nothing to serialise
+    fcntl = None
+
+from flask import request
+
+import db
+
+log = logging.getLogger("cybercase.startup")
+
+DEFAULT_BUDGET_MS = 250     # create_app() on an up-to-date deployment should fit in this
+
+
+def _timings(app):
+    return app.extensions.setdefault("startup", {"steps": {}, "total_ms": None})
+
+
+@contextlib.contextmanager
+def step(app, name):
+    """Time one phase of create_app() into app.extensions["startup"].
+
+    Each run records its own duration, so a step repeated later (e.g. by
+    `flask startup`) doesn't inflate the figures finish() reported.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings(app)["steps"][name] = (time.perf_counter() - start) * 1000
+
+
+@contextlib.contextmanager
+def deployment_lock(app):
+    """Serialise once-per-deployment work (DDL, asset builds) across workers.
+
+    The lock file sits next to the main database, so every worker of one
+    deployment shares it and a test app on scratch databases gets its own.
+    The work inside must be idempotent: the first worker does it, the rest
+    wait for the lock and then find nothing left to do.
+    """
+    path = app.config.get("STARTUP_LOCK") or db.DATABASES["main"] + ".startup-lock"
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def finish(app, started):
+    """Record the total cold-start time and complain if it blew the budget."""
+    timings = _timings(app)
+    timings["total_ms"] = total = (time.perf_counter() - started) * 1000
+    budget = float(app.config.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+    detail = ", ".join("%s %.1fms" % item for item in sorted(timings["steps"].items(), key=lambda i: -i[1]))
+    if total > budget:
+        log.warning("create_app took %.1fms (budget %.0fms): %s", total, budget, detail)
+    else:
+        log.debug("create_app took %.1fms: %s", total, detail)
+    return total
+
+
+def warn_if_multiprocess(app, what):
+    """Log once if a process-local store ends up behind several workers.
+
+    Nothing at create_app() time says how many workers will fork from the
+    app, so the first request checks the server's wsgi.multiprocess flag.
+    """
+    checked = []
+
+    @app.before_request
+    def check_workers():
+        if checked:
+            return
+        checked.append(True)
+        if request.environ.get("wsgi.multiprocess"):
+            log.warning("%s is per-process but this server runs several workers; "
+                        "each worker will see different data", what)
@@ -7,5 +7,82 @@
 // });
 // small helpers (placeholder)
 document.addEventListener('DOMContentLoaded', () => {
-  // nothing yet
+  // Evidence Eye: poll background analysis until each upload settles
+  document.querySelectorAll('[data-status-url]').forEach(el => pollStatus(el, 0));
+  // Leaderboard: first page is pushed over SSE (or polled) instead of refreshing the page
+  document.querySelectorAll('[data-poll-url]').forEach(liveLeaderboard);
+  document.querySelectorAll('[data-seconds-left]').forEach(contestClock);
 });
+
+function liveLeaderboard(table){
+  // Which payload field holds the rows and which columns to show (leaderboard by default)
+  const rowsField = table.dataset.streamRows || 'leaderboard';
+  const columns = (table.dataset.streamColumns || 'rank,badge,username,score').split(',');
+  const render = (data) => {
+    const body = table.querySelector('tbody');
+    body.replaceChildren(...(data[rowsField] || []).map(r => {
+      const tr = document.createElement('tr');
+      columns.forEach(col => {
+        const td = document.createElement('td');
+        td.textContent = r[col] == null ? '' : r[col];
+        tr.appendChild(td);
+      });
+      return tr;
+    }));
+    document.querySelectorAll('.leaderboard-total').forEach(el => el.textContent = data.total);
+    // Stream events list who just scored; the polled JSON has the viewer's own row
+    const me = data.me || (data.changed || []).find(r => String(r.user_id) === table.dataset.userId);
+    if (me && String(me.user_id) === table.dataset.userId) {
+      document.getElementById('my-rank').textContent = '#' + me.rank;
+      document.getElementById('my-score').textContent = me.score;
+    }
+  };
+  // Fallback when the server can't hold a stream open (sync workers, at capacity)
+  let polling = null;
+  const poll = () => fetch(table.dataset.pollUrl).then(res => res.json()).then(render).catch(() => {});
+  const startPolling = () => {
+    if (polling || !table.dataset.pollUrl) return;
+    polling = setInterval(poll, 15000);
+    poll();
+  };
+  if (!table.dataset.streamUrl || !window.EventSource) return startPolling();
+  // EventSource reconnects by itself and sends Last-Event-ID to catch up;
+  // it only gives up (CLOSED) on a non-200 answer such as our 503
+  const source = new EventSource(table.dataset.streamUrl);
+  const onEvent = (e) => render(JSON.parse(e.data));
+  source.addEventListener('snapshot', onEvent);
+  source.addEventListener('update', onEvent);
+  source.addEventListener('error', () => {
+    if (source.readyState === EventSource.CLOSED) startPolling();
+  });
+}
+
+function contestClock(el){
+  // Counts down from the server's figure; the server enforces the end time
+  let left = parseInt(el.dataset.secondsLeft, 10);
+  const tick = () => {
+    el.textContent = Math.floor(left / 60) + ':' + String(left % 60).padStart(2, '0');
+    if (left-- <= 0) { clearInterval(timer); window.location.reload(); }
+  };
+  const timer = setInterval(tick, 1000);
+}
+
+async function pollStatus(el, tries){
+  try {
+    const res = await fetch(el.dataset.statusUrl);
+    const data = await res.json();
+    let text = ` • ${data.status}`;
+    if (data.status === 'done' && data.result) {
+      text += ` (${data.result.detected_type}`;
+      if (data.result.mime_mismatch) text += ', type mismatch!';
+      if (data.result.executable) text += ', executable!';
+      text += ')';
+    }
+    el.innerText = text;
+    if ((data.status === 'queued' || data.status === 'running') && tries < 30) {
+      setTimeout(() => pollStatus(el, tries + 1), 1000 + tries * 500);
+    }
+  } catch (e) {
+    el.innerText = '';
+  }
+}
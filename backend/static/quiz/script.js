@@ -1,5 +1,7 @@
 let questions = [];
 let answers = {};
+let times = {};          // question id -> ms spent on it
+let shownAt = null;
 let currentIndex = 0;
 let timerValue = 0;
 let timerInterval = null;
@@ -18,7 +20,13 @@ document.addEventListener('DOMContentLoaded', ()=> {
     beginBtn.disabled = true;
     beginBtn.innerText = 'Loading...';
     try {
-      const res = await fetch('/quiz/start', {method:'POST'});
+      // /quiz?mode=adaptive asks for questions matched to the learner's level
+      const mode = new URLSearchParams(window.location.search).get('mode');
+      const res = await fetch('/quiz/start', {
+        method:'POST',
+        headers:{'Content-Type':'application/json'},
+        body: JSON.stringify(mode ? {mode: mode} : {})
+      });
       if (!res.ok) throw new Error("Quiz fetch failed");
       const data = await res.json();
       questions = data.questions;
@@ -41,11 +49,13 @@ document.addEventListener('DOMContentLoaded', ()=> {
   };
 
   prevBtn.onclick = ()=>{
+    stopClock();
     if(currentIndex>0) currentIndex--;
     renderQuestion();
     updateProgress();
   };
   nextBtn.onclick = ()=>{
+    stopClock();
     if(currentIndex < questions.length-1){
       currentIndex++;
       renderQuestion();
@@ -56,8 +66,17 @@ document.addEventListener('DOMContentLoaded', ()=> {
   };
 });
 
+function stopClock(){
+  // Add the time spent on the current question to its total
+  if(shownAt === null || !questions[currentIndex]) return;
+  const id = String(questions[currentIndex].id);
+  times[id] = (times[id] || 0) + Math.round(performance.now() - shownAt);
+  shownAt = null;
+}
+
 function renderQuestion(){
   const q = questions[currentIndex];
+  shownAt = performance.now();
   document.getElementById('qNumber').innerText = `Question ${currentIndex+1} / ${questions.length}`;
   document.getElementById('qText').innerText = q.question;
   const opts = document.getElementById('options');
@@ -98,13 +117,26 @@ function startTimer(){
 
 async function submitAnswers(){
   clearInterval(timerInterval);
-  const payload = {answers: answers};
+  stopClock();
+  const payload = {answers: answers, times: times};
   const res = await fetch('/quiz/submit', {
     method:'POST',
     headers:{'Content-Type':'application/json'},
     body: JSON.stringify(payload)
   });
   const data = await res.json();
+  // The server keeps the clock and the question set: these attempts are not scored
+  const unscored = {
+    time_up: "Time's up: this attempt was not scored.",
+    no_active_quiz: "This quiz was already submitted. Start a new one to play again.",
+    quiz_changed: "The questions changed while you played. Start a new quiz to play again.",
+  };
+  if (unscored[data.error]) {
+    document.getElementById('questionArea').classList.add('hidden');
+    document.getElementById('resultArea').classList.remove('hidden');
+    document.getElementById('scoreText').innerText = unscored[data.error];
+    return;
+  }
   showResult(data);
 }
 
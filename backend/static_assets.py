@@ -0,0 +1,171 @@
+# static_assets.py
+import gzip, hashlib, json, mimetypes, os, shutil
+
+from flask import abort, current_app, request, send_file, url_for
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = os.path.join(BASE_DIR, "static_build")
+COMPRESSIBLE = {".css", ".js", ".json", ".svg", ".txt", ".html", ".map"}
+MIN_GZIP_SIZE = 512         # below this gzip headers eat the savings
+ONE_YEAR = 365 * 24 * 3600
+
+
+def fingerprinted_name(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return "%s.%s%s" % (root, digest[:12], ext)
+
+
+class AssetPipeline:
+    """Content-hashed, gzip-precompressed copies of everything under static/.
+
+    Each file is copied once to static_build/ as name.<hash>.ext (plus a
+    .gz variant for text assets) and served from /assets/ with a one-year
+    immutable Cache-Control. A changed file gets a new hash, hence a new
+    URL, so browsers never need to revalidate.
+    """
+
+    def __init__(self, static_dir, build_dir=BUILD_DIR):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.manifest = {}      # "css/styles.css" -> "css/styles.<hash>.css"
+        self.files = {}         # "css/styles.<hash>.css" -> (built path, gz path or None, digest)
+
+    def source_signature(self):
+        """Cheap fingerprint of static/ from file sizes and mtimes (no reads)."""
+        digest = hashlib.sha256()
+        for dirpath, dirs, names in os.walk(self.static_dir):
+            dirs.sort()
+            for name in sorted(names):
+                st = os.stat(os.path.join(dirpath, name))
+                digest.update(("%s\0%d\0%d\n" % (os.path.join(dirpath, name), st.st_size, st.st_mtime_ns)).encode())
+        return digest.hexdigest()
+
+    def load(self):
+        """Reuse an existing build if static/ hasn't changed since. Returns True on success."""
+        try:
+            with open(os.path.join(self.build_dir, "manifest.json")) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(stored, dict) or stored.get("signature") != self.source_signature():
+            return False
+        manifest, files = {}, {}
+        for rel, (out_rel, digest, gzipped) in stored["assets"].items():
+            out = os.path.join(self.build_dir, out_rel)
+            if not os.path.exists(out) or (gzipped and not os.path.exists(out + ".gz")):
+                return False
+            manifest[rel] = out_rel
+            files[out_rel] = (out, out + ".gz" if gzipped else None, digest)
+        self.manifest, self.files = manifest, files
+        return True
+
+    def load_or_build(self):
+        if not self.load():
+            self.build()
+        return self.manifest
+
+    def build(self):
+        manifest, files = {}, {}
+        signature = self.source_signature()
+        os.makedirs(self.build_dir, exist_ok=True)
+        for dirpath, _, names in os.walk(self.static_dir):
+            for name in names:
+                src = os.path.join(dirpath, name)
+                rel = os.path.relpath(src, self.static_dir).replace(os.sep, "/")
+                with open(src, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                out_rel = fingerprinted_name(rel, digest)
+                out = os.path.join(self.build_dir, out_rel)
+                if not os.path.exists(out):
+                    os.makedirs(os.path.dirname(out), exist_ok=True)
+                    shutil.copyfile(src, out)
+
+                gz = None
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE and len(data) >= MIN_GZIP_SIZE:
+                    gz = out + ".gz"
+                    if not os.path.exists(gz):
+                        packed = gzip.compress(data, compresslevel=9, mtime=0)
+                        if len(packed) < len(data):
+                            with open(gz, "wb") as f:
+                                f.write(packed)
+                        else:
+                            gz = None
+                manifest[rel] = out_rel
+                files[out_rel] = (out, gz, digest)
+
+        # Written last and atomically: a manifest on disk always describes finished files
+        stored = {"signature": signature,
+                  "assets": {rel: [out_rel, files[out_rel][2], files[out_rel][1] is not None]
+                             for rel, out_rel in manifest.items()}}
+        tmp = os.path.join(self.build_dir, "manifest.json.%d" % os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        os.replace(tmp, os.path.join(self.build_dir, "manifest.json"))
+        self.manifest, self.files = manifest, files
+        return manifest
+
+    def url(self, filename, **values):
+        """Fingerprinted URL for a static file, or the plain static URL.
+
+        Debug servers always get plain URLs so edited files show up on
+        reload. This is checked per call: `app.run(debug=True)` turns debug
+        on only after the app is built.
+        """
+        built = self.manifest.get(filename)
+        if built is None or current_app.debug:
+            return url_for("static", filename=filename, **values)
+        return url_for("assets", filename=built, **values)
+
+    def serve(self, filename):
+        entry = self.files.get(filename)
+        if entry is None:
+            abort(404)
+        path, gz, digest = entry
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        encoded = gz is not None and "gzip" in request.accept_encodings
+        resp = send_file(gz if encoded else path, mimetype=mimetype, conditional=True,
+                         etag=digest + ("-gz" if encoded else ""), max_age=ONE_YEAR)
+        if encoded:
+            resp.headers["Content-Encoding"] = "gzip"
+        if gz is not None:
+            resp.vary.add("Accept-Encoding")
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
+
+
+def init_app(app, build=True):
+    """Build the asset pipeline and make url_for('static', ...) fingerprinted.
+
+    With build=False an existing build is used if it is current, and plain
+    static URLs are served otherwise.
+    """
+    pipeline = AssetPipeline(app.static_folder)
+    app.extensions["assets"] = pipeline
+    app.add_url_rule("/assets/<path:filename>", "assets", pipeline.serve)
+    app.jinja_env.globals["asset_url"] = pipeline.url
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Fingerprint and precompress everything under static/."""
+        print("built %d assets into %s" % (len(pipeline.build()), pipeline.build_dir))
+
+    # No build for a server known to be in debug; url() covers debug set later
+    if app.debug or not app.config.get("ASSET_PIPELINE", True):
+        return pipeline
+    # Workers after the first find an up-to-date build and only read its manifest
+    if build:
+        pipeline.load_or_build()
+    else:
+        pipeline.load()
+
+    default_url_for = app.jinja_env.globals["url_for"]
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == "static" and "filename" in values:
+            return pipeline.url(values.pop("filename"), **values)
+        return default_url_for(endpoint, **values)
+
+    app.jinja_env.globals["url_for"] = asset_url_for
+    return pipeline
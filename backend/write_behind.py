@@ -0,0 +1,207 @@
+# write_behind.py
+import atexit, logging, os, queue, threading, time
+
+from flask import current_app
+
+from db import connect, get_db
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_WINDOW = 0.005      # seconds the writer waits to grow a batch
+DEFAULT_MAX_BATCH = 500
+ENQUEUE_TIMEOUT = 0.05      # how long a request may block on a full queue
+_STOP = object()
+
+
+class QueueFull(Exception):
+    """The write-behind queue stayed full for ENQUEUE_TIMEOUT."""
+
+
+class Ticket:
+    """Completion handle for one queued unit of writes."""
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class WriteBehind:
+    """Single writer thread that group-commits queued writes.
+
+    Each submit() is a unit of one or more (sql, params) statements that is
+    applied atomically (inside its own SAVEPOINT). The writer takes whatever
+    has queued up in a few milliseconds and commits it as one transaction,
+    so a burst of submissions pays for one fsync instead of one each.
+    Requests return as soon as their unit is queued.
+    """
+
+    def __init__(self, db_name="main", max_queue=DEFAULT_MAX_QUEUE,
+                 window=DEFAULT_WINDOW, max_batch=DEFAULT_MAX_BATCH):
+        self.db_name = db_name
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._enqueued = 0        # units accepted so far
+        self._committed = 0       # units written (or failed) so far
+        self._thread = None
+        self._pid = None
+
+    # --- Producer side ---
+    def submit(self, *ops):
+        """Queue statements for the next group commit; returns a Ticket.
+
+        Raises QueueFull when the writer can't keep up.
+        """
+        self._ensure_started()
+        ticket = Ticket(ops)
+        try:
+            self._queue.put(ticket, timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            raise QueueFull()
+        with self._cond:
+            self._enqueued += 1
+        return ticket
+
+    def write(self, *ops):
+        """submit(), falling back to a synchronous write under backpressure."""
+        try:
+            return self.submit(*ops)
+        except QueueFull:
+            log.warning("write-behind queue full; writing synchronously")
+            conn = get_db()
+            for sql, params in ops:
+                conn.execute(sql, params)
+            conn.commit()
+            ticket = Ticket(ops)
+            ticket.done()
+            return ticket
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call is committed."""
+        with self._cond:
+            target = self._enqueued
+            return self._cond.wait_for(lambda: self._committed >= target, timeout)
+
+    # --- Writer thread ---
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while first is not _STOP and len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.db_name)
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is _STOP
+                tickets = [t for t in batch if t is not _STOP]
+                if tickets:
+                    self._commit(conn, tickets)
+                if stop:
+                    # Shutdown: push the WAL into the main file as well
+                    conn.execute("PRAGMA wal_checkpoint(FULL)")
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn, tickets):
+        errors = {}
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for i, ticket in enumerate(tickets):
+                conn.execute("SAVEPOINT unit")
+                try:
+                    for sql, params in ticket.ops:
+                        conn.execute(sql, params)
+                    conn.execute("RELEASE unit")
+                except Exception as e:      # one bad unit must not sink the batch
+                    conn.execute("ROLLBACK TO unit")
+                    conn.execute("RELEASE unit")
+                    errors[i] = e
+                    log.exception("write-behind statement failed")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.exception("write-behind batch of %d failed", len(tickets))
+            errors = dict.fromkeys(range(len(tickets)), e)
+        for i, ticket in enumerate(tickets):
+            ticket.done(errors.get(i))
+        with self._cond:
+            self._committed += len(tickets)
+            self._cond.notify_all()
+
+    def stop(self, timeout=10):
+        """Drain the queue, commit it and stop the writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+
+class SyncWriter(WriteBehind):
+    """Same interface, but writes immediately on the request connection."""
+
+    def submit(self, *ops):
+        return self.write(*ops)
+
+    def write(self, *ops):
+        conn = get_db()
+        for sql, params in ops:
+            conn.execute(sql, params)
+        conn.commit()
+        ticket = Ticket(ops)
+        ticket.done()
+        return ticket
+
+    def flush(self, timeout=None):
+        return True
+
+
+def get_writer():
+    return current_app.extensions["write_behind"]
+
+
+def init_app(app):
+    """WRITE_BEHIND=False writes synchronously (handy for debugging)."""
+    if app.config.get("WRITE_BEHIND", True):
+        writer = WriteBehind(
+            max_queue=int(app.config.get("WRITE_BEHIND_QUEUE", DEFAULT_MAX_QUEUE)),
+            window=float(app.config.get("WRITE_BEHIND_WINDOW_MS", DEFAULT_WINDOW * 1000)) / 1000,
+        )
+        atexit.register(writer.stop)
+    else:
+        writer = SyncWriter()
+    app.extensions["write_behind"] = writer
+    return writer
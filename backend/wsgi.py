@@ -0,0 +1,30 @@
+# wsgi.py
+"""WSGI entry point.
+
+    CYBERCASE_RATELIMIT_BACKEND=sqlite CYBERCASE_LIVE_MAX_STREAMS=24 \
+        gunicorn --preload -k gthread -w 4 --threads 32 wsgi:app
+
+--preload builds the app once in the master (migrations, asset build,
+drill catalog), so workers fork from a warmed process instead of each
+repeating that work.
+
+Use a threaded (gthread) or greenlet (gevent) worker class: a live
+leaderboard stream holds its thread for as long as the page is open,
+and on gunicorn's default sync workers streaming is switched off and
+pages poll instead. Keep CYBERCASE_LIVE_MAX_STREAMS below --threads so
+streams leave threads free for ordinary requests. The command above
+streams to at most 4 x 24 = 96 viewers. Viewers beyond that are refused
+and poll every 15s instead. For more streams, use more threads or
+gevent. Each worker's hub picks up the other workers' changes through
+the live_versions table, so a viewer sees every submission wherever it
+was handled.
+
+Sessions default to SQLite, which every worker shares; don't set
+CYBERCASE_SESSION_BACKEND=memory here. Rate limits default to
+per-process memory, so with 4 workers a client can get up to 4x each
+limit (logs warn about it). Set CYBERCASE_RATELIMIT_BACKEND=sqlite for
+exact limits, at the cost of one write transaction per limited POST.
+"""
+from app import create_app
+
+app = create_app()